@@ -0,0 +1,58 @@
+"""Compare two sets of results from `benchmarks/suite.py` (e.g. before and after a change).
+
+Exits with status 1 if any stage got slower or used more memory by more than
+`--threshold` (a ratio, e.g. 1.1 for 10%).
+
+Usage: python benchmarks/compare.py [--threshold THRESHOLD] BEFORE AFTER
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+
+def load(path: Path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--threshold", type=float, default=1.1)
+    args = parser.parse_args()
+
+    before = load(args.before)
+    after = load(args.after)
+    if before["parameters"] != after["parameters"]:
+        print(
+            f"Warning: Parameters differ: {before['parameters']} vs {after['parameters']}"
+        )
+
+    print(f"{'stage':28} {'seconds':>21} {'ratio':>6}   {'peak MiB':>21} {'ratio':>6}")
+    regressions = []
+    for name, new in after["stages"].items():
+        old = before["stages"].get(name)
+        if old is None:
+            print(f"{name:28} {'':>10} {new['seconds']:10.3f} {'new':>6}")
+            continue
+        time_ratio = new["seconds"] / old["seconds"] if old["seconds"] else 1.0
+        peak_ratio = new["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else 1.0
+        flag = ""
+        if time_ratio > args.threshold or peak_ratio > args.threshold:
+            regressions.append(name)
+            flag = "  <- regression"
+        print(
+            f"{name:28} {old['seconds']:10.3f} {new['seconds']:10.3f} {time_ratio:6.2f}"
+            f"   {old['peak_bytes'] / 2**20:10.1f} {new['peak_bytes'] / 2**20:10.1f} {peak_ratio:6.2f}{flag}"
+        )
+
+    if regressions:
+        print(f"{len(regressions)} stages regressed by more than {args.threshold}x")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+"""Compare `sdmx_explorer.download.pivot` with the `pivot_table` implementation it replaced.
+
+Usage: python benchmarks/pivot.py [--rows ROWS] [--periods PERIODS] [--repeat REPEAT]
+"""
+
+import numpy as np
+import pandas as pd
+
+import argparse
+import time
+
+from sdmx_explorer.download import pivot
+
+
+def pivot_table_pivot(df: pd.DataFrame) -> pd.DataFrame:
+    """The previous implementation of `pivot`, kept for comparison."""
+    TIME = "TIME_PERIOD"
+    VALUE = "value"
+    NAN_MARKER = "__THIS_IS_NAN__"
+    return (
+        df.fillna(NAN_MARKER)
+        .pivot_table(
+            index=set(df.columns).difference([TIME, VALUE]),
+            columns=TIME,
+            values=VALUE,
+        )
+        .reset_index()
+        .replace(NAN_MARKER, np.nan)
+    )
+
+
+def make_table(rows: int, periods: int, seed: int = 0) -> pd.DataFrame:
+    """Make a table of observations like a download, with a few series attributes."""
+    rng = np.random.default_rng(seed)
+    n_series = max(rows // periods, 1)
+    series = np.arange(rows) % n_series
+    areas = np.array([f"A{i:03}" for i in range(200)])
+    indicators = np.array([f"I{i:04}" for i in range(max(n_series // 200, 1))])
+    units = np.array(["USD", "EUR", None], dtype=object)
+    return pd.DataFrame(
+        {
+            "SOURCE_ID": "TEST",
+            "DATAFLOW_ID": "BENCH",
+            "REF_AREA": areas[series % len(areas)],
+            "INDICATOR": indicators[(series // len(areas)) % len(indicators)],
+            "FREQ": "A",
+            # Missing for some series, like an optional attribute.
+            "UNIT": units[series % len(units)],
+            "TIME_PERIOD": (1900 + np.arange(rows) // n_series).astype(str),
+            "value": rng.random(rows),
+        }
+    )
+
+
+def run(f, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(df)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--periods", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    df = make_table(args.rows, args.periods)
+    print(f"{len(df)} rows, {args.periods} periods")
+
+    new, new_time = run(pivot, df, args.repeat)
+    print(f"pivot:             {new_time:8.2f}s")
+    old, old_time = run(pivot_table_pivot, df, args.repeat)
+    print(f"pivot_table_pivot: {old_time:8.2f}s ({old_time / new_time:.1f}x)")
+
+    # Check that both produce the same table, up to the order of rows and columns.
+    old = old[list(new.columns)].sort_values(list(new.columns[: -args.periods]))
+    old.columns.name = new.columns.name = None
+    pd.testing.assert_frame_equal(
+        old.reset_index(drop=True), new.reset_index(drop=True), check_dtype=False
+    )
+
+
+if __name__ == "__main__":
+    main()
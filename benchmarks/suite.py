@@ -0,0 +1,237 @@
+"""Benchmark each stage of a download against a synthetic dataflow, without a network connection.
+
+Each stage is timed (the best of `--repeat` runs), then run once more with
+`tracemalloc` to measure its peak memory use (which only includes memory allocated
+through Python, e.g. not by pyarrow). Messages kept in memory by `sdmx` are cleared
+before each run, and every run of a stage must send the same number of requests.
+The results are written as JSON, which can be compared between commits with
+`benchmarks/compare.py`.
+
+Usage: python benchmarks/suite.py [--series SERIES] [--observations OBSERVATIONS]
+    [--dimensions DIMENSIONS] [--codes CODES] [--repeat REPEAT] [--stage STAGE]...
+    [--output OUTPUT]
+"""
+
+from rich.console import Console
+import sdmx
+
+import argparse
+from dataclasses import asdict
+import io
+import json
+import platform
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sdmx_explorer.context import SdmxContext
+from sdmx_explorer.display import THEME
+from sdmx_explorer.download import DownloadConfig, pivot, save_as
+from sdmx_explorer.parse import read_csv_data, read_data, to_frame
+from sdmx_explorer.path import SdmxQuery
+from synthetic import (
+    DATAFLOW_ID,
+    SOURCE_ID,
+    Synthetic,
+    SyntheticAdapter,
+    offline_client,
+)
+
+
+SAVE_FORMATS = [".parquet", ".feather", ".csv", ".pkl"]
+
+
+def context(synthetic: Synthetic) -> SdmxContext:
+    return SdmxContext(client=offline_client(synthetic))
+
+
+def selected(synthetic: Synthetic) -> SdmxContext:
+    ctx = context(synthetic)
+    ctx.select_source(SOURCE_ID)
+    ctx.select_dataflow(DATAFLOW_ID)
+    return ctx
+
+
+def table(synthetic: Synthetic):
+    """Get the synthetic data as a download would have it before saving."""
+    df = to_frame(sdmx.read_sdmx(io.BytesIO(synthetic.data_xml)))
+    df.insert(0, "SOURCE_ID", SOURCE_ID)
+    df.insert(1, "DATAFLOW_ID", DATAFLOW_ID)
+    return df
+
+
+def stages(synthetic: Synthetic, tmp: Path) -> dict:
+    """Get each stage, as a function that prepares its input and returns the stage itself."""
+    dimensions = [*synthetic.dimension_ids, "TIME_PERIOD"]
+
+    def select_dataflow():
+        ctx = context(synthetic)
+        ctx.select_source(SOURCE_ID)
+        return lambda: ctx.select_dataflow(DATAFLOW_ID)
+
+    def select_key():
+        ctx = selected(synthetic)
+        key = synthetic.key(synthetic.codes // 2)
+        # Request the codelists before timing.
+        ctx.select_key(key)
+        return lambda: ctx.select_key(key)
+
+    def parse_sdmx():
+        return lambda: to_frame(sdmx.read_sdmx(io.BytesIO(synthetic.data_xml)))
+
+    def parse_stream():
+        return lambda: read_data(io.BytesIO(synthetic.data_xml))
+
+    def parse_csv():
+        return lambda: read_csv_data(
+            io.BytesIO(synthetic.data_csv), dimensions=dimensions, measure="OBS_VALUE"
+        )
+
+    def pivot_stage():
+        df = table(synthetic)
+        return lambda: pivot(df)
+
+    def save_as_stage(suffix):
+        def prepare():
+            df = table(synthetic)
+            return lambda: save_as(df, tmp / f"save_as{suffix}")
+
+        return prepare
+
+    def download(**options):
+        def prepare():
+            ctx = selected(synthetic)
+            ctx.console = Console(theme=THEME, file=io.StringIO())
+            config = DownloadConfig(
+                output_path=tmp / "download.parquet",
+                queries=[
+                    SdmxQuery(
+                        source=SOURCE_ID, dataflow=DATAFLOW_ID, key=synthetic.key()
+                    )
+                ],
+                use_cache=False,
+                **options,
+            )
+            return lambda: config.download(ctx=ctx)
+
+        return prepare
+
+    return {
+        "context.select_dataflow": select_dataflow,
+        "context.select_key": select_key,
+        "parse.sdmx": parse_sdmx,
+        "parse.stream": parse_stream,
+        "parse.csv": parse_csv,
+        "pivot": pivot_stage,
+        **{f"save_as{suffix}": save_as_stage(suffix) for suffix in SAVE_FORMATS},
+        "download": download(),
+        "download.stream_parse": download(stream_parse=True),
+        "download.sdmx_csv": download(data_format="sdmx-csv"),
+    }
+
+
+def fresh(prepare):
+    """Prepare a stage from scratch, without any messages that `sdmx` kept in memory."""
+    # Otherwise every run after the first would skip requesting and parsing them.
+    sdmx.Client.cache.clear()
+    f = prepare()
+    sent = SyntheticAdapter.sent
+    return f, lambda: SyntheticAdapter.sent - sent
+
+
+def measure(name: str, prepare, repeat: int) -> dict:
+    best = float("inf")
+    requests = set()
+    for _ in range(repeat):
+        f, sent = fresh(prepare)
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+        requests.add(sent())
+
+    f, sent = fresh(prepare)
+    tracemalloc.start()
+    try:
+        f()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    requests.add(sent())
+
+    # Runs that do different work can't be compared.
+    if len(requests) > 1:
+        raise RuntimeError(
+            f"Runs of stage {name!r} sent different numbers of requests: {sorted(requests)}"
+        )
+    return {"seconds": best, "peak_bytes": peak, "requests": requests.pop()}
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--series", type=int, default=1000)
+    parser.add_argument("--observations", type=int, default=50)
+    parser.add_argument("--dimensions", type=int, default=4)
+    parser.add_argument("--codes", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--stage",
+        action="append",
+        default=None,
+        help="Only run this stage (or stages starting with it, e.g. 'parse').",
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    # TODO: Actually fix the warning instead of suppressing it.
+    sdmx.log.setLevel(100)
+
+    synthetic = Synthetic(
+        series=args.series,
+        observations=args.observations,
+        dimensions=args.dimensions,
+        codes=args.codes,
+    )
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, prepare in stages(synthetic, Path(tmp)).items():
+            if args.stage and not any(
+                name == x or name.startswith(f"{x}.") for x in args.stage
+            ):
+                continue
+            results[name] = measure(name, prepare, args.repeat)
+            print(
+                f"{name:28} {results[name]['seconds']:9.3f}s {results[name]['peak_bytes'] / 2**20:9.1f} MiB",
+                file=sys.stderr,
+            )
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "parameters": {**asdict(synthetic), "repeat": args.repeat},
+        "stages": results,
+    }
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
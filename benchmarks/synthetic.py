@@ -0,0 +1,223 @@
+"""Synthetic SDMX structures and data messages, served without a network connection."""
+
+import numpy as np
+import requests
+import sdmx
+from sdmx.message import StructureMessage
+from sdmx.model import common, v21
+
+from dataclasses import dataclass
+from functools import cached_property
+import io
+import threading
+from urllib.parse import urlparse
+
+
+# A real source, so that `sdmx.Client` builds the same URLs as it would online.
+SOURCE_ID = "ECB"
+AGENCY_ID = "BENCH"
+DATAFLOW_ID = "FLOW"
+
+
+@dataclass(frozen=True)
+class Synthetic:
+    """A synthetic dataflow with `dimensions` coded dimensions and a time dimension.
+
+    Each dimension has a codelist of `codes` codes. The data message has `series` time
+    series (spread over the codes of every dimension) with `observations` each.
+    """
+
+    series: int = 1000
+    observations: int = 50
+    dimensions: int = 4
+    codes: int = 50
+
+    @cached_property
+    def structures(self) -> StructureMessage:
+        agency = common.Agency(id=AGENCY_ID)
+        msg = StructureMessage()
+        concepts = common.ConceptScheme(id="CONCEPTS", maintainer=agency, version="1.0")
+        dsd = v21.DataStructureDefinition(id="DSD", maintainer=agency, version="1.0")
+        for i, dimension_id in enumerate(self.dimension_ids):
+            codelist = common.Codelist(
+                id=f"CL_{dimension_id}", maintainer=agency, version="1.0"
+            )
+            for code_id in self.code_ids:
+                codelist.append(common.Code(id=code_id, name=f"Code {code_id}"))
+            msg.add(codelist)
+            concept = common.Concept(id=dimension_id, name=f"Dimension {i}")
+            concepts.append(concept)
+            dsd.dimensions.append(
+                common.Dimension(
+                    id=dimension_id,
+                    order=i,
+                    concept_identity=concept,
+                    local_representation=common.Representation(enumerated=codelist),
+                )
+            )
+        for concept_id in ["TIME_PERIOD", "OBS_VALUE", "UNIT"]:
+            concepts.append(common.Concept(id=concept_id, name=concept_id))
+        dsd.dimensions.append(
+            common.TimeDimension(
+                id="TIME_PERIOD",
+                order=self.dimensions,
+                concept_identity=concepts["TIME_PERIOD"],
+            )
+        )
+        dsd.measures.append(
+            v21.PrimaryMeasure(id="OBS_VALUE", concept_identity=concepts["OBS_VALUE"])
+        )
+        dsd.attributes.append(
+            v21.DataAttribute(id="UNIT", concept_identity=concepts["UNIT"])
+        )
+        msg.add(concepts)
+        msg.add(dsd)
+        msg.add(
+            v21.DataflowDefinition(
+                id=DATAFLOW_ID,
+                maintainer=agency,
+                version="1.0",
+                structure=dsd,
+                name="Synthetic benchmark dataflow",
+            )
+        )
+        return msg
+
+    @property
+    def dimension_ids(self) -> list[str]:
+        return [f"DIM{i}" for i in range(self.dimensions)]
+
+    @property
+    def code_ids(self) -> list[str]:
+        return [f"C{i:04}" for i in range(self.codes)]
+
+    def series_keys(self) -> np.ndarray:
+        """Get the code of each dimension in each series, as a (series, dimensions) array."""
+        # Count through the codes like the digits of a number, so that every series is
+        # distinct (as long as there are enough codes).
+        index = np.arange(self.series)
+        digits = []
+        for _ in range(self.dimensions):
+            digits.append(index % self.codes)
+            index = index // self.codes
+        return np.array(self.code_ids, dtype=object)[np.stack(digits, axis=1)]
+
+    def key(self, selected: int = 1) -> str:
+        """Get a data query key that selects the first `selected` codes of every dimension."""
+        return ".".join(["+".join(self.code_ids[:selected])] * self.dimensions)
+
+    @cached_property
+    def structure_xml(self) -> bytes:
+        return sdmx.to_xml(self.structures)
+
+    def codelist_xml(self, codelist_id: str) -> bytes:
+        msg = StructureMessage()
+        msg.add(self.structures.codelist[codelist_id])
+        return sdmx.to_xml(msg)
+
+    @cached_property
+    def data_xml(self) -> bytes:
+        """Get the data message in the SDMX-ML 2.1 generic format."""
+        lines = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<message:GenericData xmlns:message="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/message" xmlns:generic="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/data/generic" xmlns:common="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/common">',
+            "<message:Header><message:ID>BENCH</message:ID><message:Test>true</message:Test>"
+            '<message:Prepared>2000-01-01T00:00:00</message:Prepared><message:Sender id="BENCH"/>'
+            '<message:Structure structureID="DSD" dimensionAtObservation="TIME_PERIOD"><common:Structure>'
+            f'<Ref agencyID="{AGENCY_ID}" id="DSD" version="1.0"/></common:Structure></message:Structure></message:Header>',
+            '<message:DataSet structureRef="DSD">',
+        ]
+        rng = np.random.default_rng(0)
+        for codes in self.series_keys():
+            values = "".join(
+                f'<generic:Value id="{dimension_id}" value="{code}"/>'
+                for dimension_id, code in zip(self.dimension_ids, codes)
+            )
+            lines.append(
+                f"<generic:Series><generic:SeriesKey>{values}</generic:SeriesKey>"
+                '<generic:Attributes><generic:Value id="UNIT" value="USD"/></generic:Attributes>'
+            )
+            for period, value in zip(
+                range(2000 - self.observations, 2000),
+                rng.random(self.observations),
+            ):
+                lines.append(
+                    f'<generic:Obs><generic:ObsDimension value="{period}"/><generic:ObsValue value="{value:.6f}"/></generic:Obs>'
+                )
+            lines.append("</generic:Series>")
+        lines.append("</message:DataSet></message:GenericData>")
+        return "\n".join(lines).encode()
+
+    @cached_property
+    def data_csv(self) -> bytes:
+        """Get the data message in the SDMX-CSV 1.0 format."""
+        rng = np.random.default_rng(0)
+        header = ",".join(
+            ["DATAFLOW", *self.dimension_ids, "TIME_PERIOD", "OBS_VALUE", "UNIT"]
+        )
+        lines = [header]
+        dataflow = f"{AGENCY_ID}:{DATAFLOW_ID}(1.0)"
+        for codes in self.series_keys():
+            prefix = ",".join([dataflow, *codes])
+            for period, value in zip(
+                range(2000 - self.observations, 2000),
+                rng.random(self.observations),
+            ):
+                lines.append(f"{prefix},{period},{value:.6f},USD")
+        return "\n".join(lines).encode()
+
+
+class SyntheticAdapter(requests.adapters.BaseAdapter):
+    """Respond to SDMX REST requests with a synthetic dataflow instead of the network.
+
+    Every request sent to any `SyntheticAdapter` is counted in `sent`, so that the
+    work done by each run of a benchmark can be compared.
+    """
+
+    sent = 0
+    _lock = threading.Lock()
+
+    def __init__(self, synthetic: Synthetic):
+        super().__init__()
+        self.synthetic = synthetic
+
+    def send(self, request, stream=False, **kwargs):
+        with SyntheticAdapter._lock:
+            SyntheticAdapter.sent += 1
+        parts = urlparse(request.url).path.split("/")
+        accept = request.headers.get("Accept", "")
+        if "data" in parts:
+            if "csv" in accept:
+                content = self.synthetic.data_csv
+                content_type = "application/vnd.sdmx.data+csv; version=1.0.0"
+            else:
+                content = self.synthetic.data_xml
+                content_type = "application/vnd.sdmx.genericdata+xml; version=2.1"
+        elif "codelist" in parts:
+            codelist_id = parts[parts.index("codelist") + 2]
+            content = self.synthetic.codelist_xml(codelist_id)
+            content_type = "application/vnd.sdmx.structure+xml; version=2.1"
+        else:
+            content = self.synthetic.structure_xml
+            content_type = "application/vnd.sdmx.structure+xml; version=2.1"
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response.headers["Content-Type"] = content_type
+        response.raw = io.BytesIO(content)
+        if not stream:
+            response._content = content
+        return response
+
+    def close(self):
+        pass
+
+
+def offline_client(synthetic: Synthetic) -> sdmx.Client:
+    """Make an SDMX client for `SOURCE_ID` that is served by `SyntheticAdapter`."""
+    client = sdmx.Client(SOURCE_ID)
+    client.session.mount("https://", SyntheticAdapter(synthetic))
+    client.session.mount("http://", SyntheticAdapter(synthetic))
+    return client
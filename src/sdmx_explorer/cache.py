@@ -0,0 +1,115 @@
+import pandas as pd
+
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+from .path import SdmxQuery
+
+
+CACHE_DIR: Path = Path(__file__).parent.parent.parent / "cache"
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """Metadata saved next to a cached query result to decide its freshness."""
+
+    path: str
+    rows: int
+    sha256: str
+    fetched_at: str
+    url: str | None = None
+    dimensions: list[str] | None = None
+
+    def age(self) -> float:
+        """Get the number of seconds since the query result was fetched."""
+        fetched_at = datetime.fromisoformat(self.fetched_at)
+        return (datetime.now(timezone.utc) - fetched_at).total_seconds()
+
+
+def cache_path(query: SdmxQuery) -> Path:
+    """Get the file path where an SDMX query should be cached."""
+    # Asterisk is an invalid character for file paths on Windows.
+    key = query.key.replace("*", "(ALL)")
+    return CACHE_DIR / query.source / query.dataflow / f"{key}.tsv"
+
+
+def metadata_path(query: SdmxQuery) -> Path:
+    """Get the file path where the metadata for a cached SDMX query should be saved."""
+    return cache_path(query).with_suffix(".json")
+
+
+def write_cached(
+    query: SdmxQuery,
+    df: pd.DataFrame | Iterable[pd.DataFrame],
+    url: str | None = None,
+    dimensions: list[str] | None = None,
+) -> CacheEntry:
+    """Save a query result to its `cache_path` along with its metadata.
+
+    The query result can also be given as chunks of its rows, with the same columns.
+    """
+    path = cache_path(query)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    for i, chunk in enumerate([df] if isinstance(df, pd.DataFrame) else df):
+        chunk.to_csv(
+            path, sep="\t", index=False, header=i == 0, mode="w" if i == 0 else "a"
+        )
+        rows += len(chunk)
+    entry = CacheEntry(
+        path=str(path),
+        rows=rows,
+        sha256=file_hash(path),
+        fetched_at=datetime.now(timezone.utc).isoformat(),
+        url=url,
+        dimensions=dimensions,
+    )
+
+    # Write atomically so that an interrupted save can't corrupt the metadata.
+    meta_path = metadata_path(query)
+    tmp_path = meta_path.with_name(f".{meta_path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(asdict(entry), f, indent=2)
+    os.replace(tmp_path, meta_path)
+
+    return entry
+
+
+def load_cached(query: SdmxQuery, ttl: float) -> CacheEntry | None:
+    """Get the metadata for a cached query result, if it's intact and fresher than `ttl` seconds."""
+    if ttl <= 0:
+        return None
+    try:
+        with open(metadata_path(query)) as f:
+            entry = CacheEntry(**json.load(f))
+        if entry.age() < ttl and file_hash(Path(entry.path)) == entry.sha256:
+            return entry
+    except (FileNotFoundError, TypeError, ValueError):
+        pass
+    return None
+
+
+def upsert(old: pd.DataFrame, new: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """Merge new or revised rows into an older table, matching rows by `keys`."""
+    keys = [key for key in keys if key in old.columns and key in new.columns]
+    return pd.concat([old, new], ignore_index=True).drop_duplicates(
+        subset=keys, keep="last", ignore_index=True
+    )
+
+
+def read_cached(path: Path) -> pd.DataFrame:
+    """Read a query result that was saved to its `cache_path`."""
+    # Read every column as a string, the same as the original SDMX message.
+    df = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False, na_values=[""])
+    df["value"] = df["value"].astype(float)
+    return df
+
+
+def file_hash(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
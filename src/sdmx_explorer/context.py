@@ -1,19 +1,37 @@
+from requests_cache import DO_NOT_CACHE
 from rich.markup import escape
 import sdmx
 from sdmx.model import TimeDimension
 from sdmx.source import NoSource
 
+from contextlib import nullcontext
+import time
+
+from .parse import to_frame
 from .path import SdmxPath
+from .stats import Stats
+from .store import is_structure_request
+
+
+# Enough for every structure request of a session, and the recent data requests.
+REQUEST_CACHE_SIZE = 1024
 
 
 class SdmxContext:
-    def __init__(self, client=None, console=None):
+    def __init__(self, client=None, console=None, limiter=None, store=None, stats=None):
         if client is None:
             client = sdmx.Client()
+        if stats is None:
+            stats = Stats()
         self.client = client
         self.console = console
+        self.limiter = limiter
+        self.store = store
+        self.stats = stats
         self.dataflow = None
         self.key_codes = None
+        self._indexes = {}
+        self._requests = {}
 
     def __repr__(self):
         return f"{self.__class__.__name__}(path={self.path().to_str()!r})"
@@ -49,10 +67,7 @@ class SdmxContext:
         ):
             return dimension
         elif isinstance(dimension, str):
-            try:
-                return next(x for x in self.key_dimensions() if x.id == dimension)
-            except StopIteration:
-                raise KeyError(dimension)
+            return self._key_dimension_index().by_id[dimension]
         elif isinstance(dimension, int):
             if dimension < 0:
                 raise IndexError("List index is negative")
@@ -64,10 +79,7 @@ class SdmxContext:
         if isinstance(dimension, sdmx.model.common.Dimension):
             return dimension
         elif isinstance(dimension, str):
-            try:
-                return next(x for x in self.dimensions() if x.id == dimension)
-            except StopIteration:
-                raise KeyError(dimension)
+            return self._dimension_index().by_id[dimension]
         elif isinstance(dimension, int):
             if dimension < 0:
                 raise IndexError("List index is negative")
@@ -93,6 +105,7 @@ class SdmxContext:
         self.client.source = NoSource
         self.dataflow = None
         self.key_codes = None
+        self._indexes.clear()
 
     def back(self):
         if self.dataflow is not None:
@@ -206,8 +219,12 @@ class SdmxContext:
         return [sdmx.source.sources[x] for x in sdmx.list_sources()]
 
     def dataflows(self):
-        msg = self.get_dataflow()
-        return sorted(msg.dataflow.values())
+        return self._dataflow_index().items
+
+    def dataflow_position(self, dataflow):
+        """Get the position of a dataflow in `dataflows()`."""
+        dataflow = self.to_dataflow(dataflow)
+        return self._dataflow_index().position(dataflow)
 
     def datastructure(self):
         msg = self.get_datastructure()
@@ -217,7 +234,12 @@ class SdmxContext:
         return self.datastructure().dimensions.components
 
     def key_dimensions(self):
-        return [x for x in self.dimensions() if not isinstance(x, TimeDimension)]
+        return self._key_dimension_index().items
+
+    def key_dimension_position(self, dimension):
+        """Get the position of a dimension in `key_dimensions()`."""
+        dimension = self.to_key_dimension(dimension)
+        return self._key_dimension_index().position(dimension)
 
     def attributes(self):
         return self.datastructure().attributes.components
@@ -226,13 +248,53 @@ class SdmxContext:
         return self.datastructure().measures.components
 
     def codes(self, dimension):
+        return self._code_index(dimension).items
+
+    def code_position(self, dimension, code):
+        """Get the position of a code in `codes(dimension)`."""
+        code = self.to_code(dimension, code)
+        return self._code_index(dimension).position(code)
+
+    def _dataflow_index(self):
+        msg = self.get_dataflow()
+        return self._index(("dataflows",), msg, lambda: sorted(msg.dataflow.values()))
+
+    def _dimension_index(self):
+        dsd = self.datastructure()
+        return self._index(("dimensions",), dsd, lambda: dsd.dimensions.components)
+
+    def _key_dimension_index(self):
+        dsd = self.datastructure()
+        return self._index(
+            ("key_dimensions",),
+            dsd,
+            lambda: [
+                x for x in dsd.dimensions.components if not isinstance(x, TimeDimension)
+            ],
+        )
+
+    def _code_index(self, dimension):
+        dimension = self.to_key_dimension(dimension)
         msg = self.get_codelist(dimension)
-        return sorted(next(iter(msg.codelist.values())).items.values())
+        return self._index(
+            ("codes", dimension.id),
+            msg,
+            lambda: sorted(next(iter(msg.codelist.values())).items.values()),
+        )
 
-    def data(self):
-        msg = self.get_data()
-        if msg.data[0].series:
-            return sdmx.to_pandas(msg).reset_index()
+    def _index(self, key, source, items):
+        # Indexes are rebuilt whenever the structure they were built from changes
+        # (e.g. because another source or dataflow was selected).
+        entry = self._indexes.get(key)
+        if entry is None or entry[0] is not source:
+            entry = (source, _Index(items()))
+            self._indexes[key] = entry
+        return entry[1]
+
+    def data(self, **kwargs):
+        msg = self.get_data(**kwargs)
+        with self.stats.time(self.client.source.id, "to_pandas"):
+            return to_frame(msg)
 
     def get_dataflow(self, **kwargs):
         return self.get(
@@ -253,7 +315,7 @@ class SdmxContext:
             **kwargs,
         )
 
-    def get_codelist(self, dimension, **kwargs):
+    def codelist(self, dimension):
         dimension = self.to_key_dimension(dimension)
         representation = (
             dimension.local_representation
@@ -262,7 +324,10 @@ class SdmxContext:
         codelist = representation.enumerated
         if codelist is None:
             raise ValueError("No codelist associated with the given dimension")
+        return codelist
 
+    def get_codelist(self, dimension, **kwargs):
+        codelist = self.codelist(dimension)
         return self.get(
             resource_type="codelist",
             resource_id=codelist.id,
@@ -279,35 +344,169 @@ class SdmxContext:
             **kwargs,
         )
 
-    def get(self, **kwargs):
-        if self.client.source is NoSource:
-            raise MissingSelectionError("No source selected")
-        resource_type = kwargs.get("resource_type")
-        if not self.client.source.supports.get(resource_type, False):
-            raise UnsupportedQueryError(
-                f'Source does not support "{resource_type}" queries'
-            )
+    def get_data_content(self, **kwargs):
+        key = self.key()
+        return self.get_content(
+            resource_type="data",
+            resource_id=self.dataflow.id,
+            key=key,
+            **kwargs,
+        )
 
-        kwargs["use_cache"] = True
-        if self.console is None or kwargs.get("dry_run", False):
-            msg = self.client.get(**kwargs)
-        else:
-            dry_run_kwargs = dict(kwargs)
-            dry_run_kwargs["dry_run"] = True
-            req = self.client.get(**dry_run_kwargs)
-            if req.url in self.client.cache:
-                msg = self.client.cache[req.url]
-            else:
-                with self.console.status(
-                    f"Requesting: [dim][link {req.url}]{escape(req.url)}[/][/]"
-                ):
-                    msg = self.client.get(**kwargs)
+    def get(self, dry_run=False, **kwargs):
+        self._check_supported(kwargs.get("resource_type"))
+
+        source_id = self.client.source.id
+        with self.stats.time(source_id, "build"):
+            req = self._request(**kwargs)
+        if dry_run:
+            return req
+
+        store = self.store if is_structure_request(kwargs) else None
+        # Data messages aren't kept in memory (`sdmx.Client.cache` is shared by every
+        # client and never evicted), so that each one can be freed once it's used.
+        # The HTTP cache still keeps their responses.
+        use_cache = kwargs.get("resource_type") != "data"
+        with self.stats.time(source_id, "cache"):
+            # Messages already in memory aren't counted as hits, which only count what
+            # was saved on disk.
+            msg = self.client.cache.get(req.url) if use_cache else None
+            if msg is None and store is not None:
+                # Parsed by this or another process.
+                msg = store.load(source_id, kwargs)
+                if msg is not None:
+                    self.stats.add(source_id, "hits")
+                    self.client.cache[req.url] = msg
+        if msg is None:
+            if self.limiter is not None:
+                self.limiter.acquire(source_id)
+            with self._status(req):
+                start = time.perf_counter()
+                msg = self.client.get(use_cache=use_cache, **kwargs)
+                elapsed = time.perf_counter() - start
+            # The response is received and then parsed, so only the time until it
+            # started to arrive is known.
+            response = getattr(msg, "response", None)
+            network = 0
+            if response is not None and not getattr(response, "from_cache", False):
+                network = min(response.elapsed.total_seconds(), elapsed)
+            self._record_response(
+                response,
+                network=network,
+                content=None if response is None else response.content,
+            )
+            self.stats.add(source_id, "parse", elapsed - network)
+            if store is not None and msg is not None:
+                with self.stats.time(source_id, "cache"):
+                    store.save(source_id, kwargs, msg)
 
         if msg is None:
             raise EmptyResponseError()
 
         return msg
 
+    def get_content(self, stream=False, accept=None, **kwargs):
+        """Request a resource like `get`, but return the raw content of the response.
+
+        The content is neither parsed nor cached, so that it can be parsed elsewhere
+        (e.g. with `parse.parse_data` in another process). If `stream` is true, a
+        file-like object is returned instead, which reads the content as it is
+        received. If `accept` is a media type (e.g. SDMX-CSV), the response must be in
+        the same format.
+        """
+        self._check_supported(kwargs.get("resource_type"))
+
+        if accept is not None:
+            kwargs["headers"] = {**kwargs.get("headers", {}), "Accept": accept}
+        source_id = self.client.source.id
+        with self.stats.time(source_id, "build"):
+            req = self._request(**kwargs)
+        send_kwargs = dict(self.client._send_kwargs)
+        if stream:
+            # The HTTP cache would receive the entire response before returning it.
+            send_kwargs["expire_after"] = DO_NOT_CACHE
+        if self.limiter is not None:
+            self.limiter.acquire(source_id)
+        start = time.perf_counter()
+        with self._status(req):
+            response = self.client.session.send(
+                req.copy(), stream=stream, **send_kwargs
+            )
+            if accept is not None:
+                content_type = response.headers.get("Content-Type", "")
+                if response.status_code in (406, 415) or (
+                    response.ok and _format(content_type) != _format(accept)
+                ):
+                    response.close()
+                    raise UnsupportedFormatError(
+                        f"Source does not support {accept!r} responses"
+                    )
+            response.raise_for_status()
+
+        if stream:
+            # The content is received while it's parsed.
+            self._record_response(response, network=time.perf_counter() - start)
+            # Undo any `Content-Encoding` (e.g. gzip) while reading.
+            response.raw.decode_content = True
+            return response.raw
+
+        content = response.content
+        self._record_response(
+            response, network=time.perf_counter() - start, content=content
+        )
+        if not content:
+            raise EmptyResponseError()
+
+        return content
+
+    def _request(self, **kwargs):
+        """Prepare the request for a resource, reusing the one prepared last time."""
+        try:
+            key = (self.client.source.id, _freeze(kwargs))
+            req = self._requests.get(key)
+        except TypeError:
+            # Unhashable arguments (e.g. a DSD to validate the key with).
+            return self.client.get(dry_run=True, **kwargs)
+        if req is None:
+            req = self.client.get(dry_run=True, **kwargs)
+            if len(self._requests) >= REQUEST_CACHE_SIZE:
+                self._requests.pop(next(iter(self._requests)), None)
+            self._requests[key] = req
+        return req
+
+    def _record_response(self, response, network, content=None):
+        source_id = self.client.source.id
+        if response is None:
+            # Already in memory (e.g. requested by another thread), so not a hit.
+            return
+        if getattr(response, "from_cache", False):
+            # Responses from the HTTP cache aren't received again.
+            self.stats.add(source_id, "hits")
+            self.stats.add(source_id, "cache", network)
+            return
+        self.stats.add(source_id, "misses")
+        self.stats.add(source_id, "network", network)
+        size = response.headers.get("Content-Length")
+        if size is not None and size.isdigit():
+            self.stats.add(source_id, "bytes", int(size))
+        elif content is not None:
+            self.stats.add(source_id, "bytes", len(content))
+
+    def _status(self, req):
+        if self.console is None:
+            return nullcontext()
+        return self.console.status(
+            f"Requesting: [dim][link {req.url}]{escape(req.url)}[/][/]"
+        )
+
+    def _check_supported(self, resource_type):
+        if self.client.source is NoSource:
+            raise MissingSelectionError("No source selected")
+        if not self.client.source.supports.get(resource_type, False):
+            raise UnsupportedQueryError(
+                f'Source does not support "{resource_type}" queries'
+            )
+
 
 class SdmxContextError(Exception):
     """Base class for exceptions in `SdmxContext` operations."""
@@ -323,3 +522,39 @@ class MissingSelectionError(SdmxContextError):
 
 class EmptyResponseError(SdmxContextError):
     """Raised when an SDMX query receives an empty response."""
+
+
+class UnsupportedFormatError(SdmxContextError):
+    """Raised when the selected SDMX source does not respond in the requested format."""
+
+
+class _Index:
+    """A list of identifiable objects, with constant-time lookups by ID."""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.by_id = {x.id: x for x in self.items}
+        self.positions = {x.id: i for i, x in enumerate(self.items)}
+
+    def position(self, item):
+        try:
+            return self.positions[item.id]
+        except KeyError:
+            raise ValueError(f"{item!r} is not in list")
+
+
+def _freeze(value):
+    """Convert request arguments to a hashable value."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(x) for x in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(x) for x in value)
+    return value
+
+
+def _format(media_type):
+    """Get the format of a media type (e.g. 'csv' for 'application/vnd.sdmx.data+csv')."""
+    media_type = media_type.split(";")[0].strip().lower()
+    return media_type.rpartition("+")[2].rpartition("/")[2]
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+import zlib
+
+
+class HashSet:
+    """A compact set of 64-bit hashes, stored as a few sorted arrays.
+
+    Arrays of similar size are merged together as hashes are added (like the digits of
+    a binary counter), so there are only O(log n) arrays to search, and each hash is
+    only merged O(log n) times.
+    """
+
+    def __init__(self):
+        # Sorted arrays of unique hashes, from largest to smallest.
+        self._levels = []
+
+    def __len__(self):
+        return sum(len(level) for level in self._levels)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Check which of the given hashes are in the set."""
+        # Searching for sorted hashes is much faster.
+        order = np.argsort(hashes)
+        hashes = hashes[order]
+        found = np.zeros(len(hashes), dtype=bool)
+        for level in self._levels:
+            i = np.searchsorted(level, hashes)
+            i[i == len(level)] = 0
+            found |= level[i] == hashes
+        result = np.empty_like(found)
+        result[order] = found
+        return result
+
+    def add(self, hashes: np.ndarray):
+        """Add hashes that aren't in the set yet (see `contains`)."""
+        if not len(hashes):
+            return
+        new = np.sort(hashes)
+        new = new[np.concatenate(([True], new[1:] != new[:-1]))]
+        while self._levels and len(self._levels[-1]) <= len(new):
+            # The hashes are new, so merging is just sorting.
+            new = np.sort(np.concatenate((self._levels.pop(), new)))
+        self._levels.append(new)
+
+
+class Deduplicator:
+    """Drop rows from each table that are duplicates of rows in earlier tables (or itself).
+
+    Rows are the same as they would be for `pd.concat(...).drop_duplicates()`: a row
+    matches another if their non-null values are the same, in the same columns.
+    """
+
+    def __init__(self):
+        self.seen = HashSet()
+        # The number of rows that were already received from an earlier table.
+        self.overlapping = 0
+
+    def drop(self, df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+        """Drop duplicate rows, and count how many were already in an earlier table."""
+        hashes = row_hashes(df)
+        repeated = pd.Series(hashes).duplicated().to_numpy()
+        seen = self.seen.contains(hashes)
+        overlapping = int((seen & ~repeated).sum())
+        self.overlapping += overlapping
+        self.seen.add(hashes[~seen])
+        keep = ~(seen | repeated)
+        if keep.all():
+            return df, overlapping
+        if not isinstance(df, pd.DataFrame):
+            # An Arrow table.
+            return df.filter(keep), overlapping
+        return df[keep].reset_index(drop=True), overlapping
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Hash each row of a table by its non-null values and the columns they are in.
+
+    The hash doesn't depend on the order of the columns, and a null value hashes the
+    same as a missing column, so that tables with different columns can be compared.
+    """
+    if not isinstance(df, pd.DataFrame):
+        return _table_row_hashes(df)
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    for column in df.columns:
+        values = df[column]
+        cells = pd.util.hash_pandas_object(values, index=False).to_numpy(copy=True)
+        cells ^= _salt(column)
+        cells[values.isna().to_numpy()] = 0
+        hashes += cells
+    return hashes
+
+
+def _table_row_hashes(table) -> np.ndarray:
+    """Hash each row of an Arrow table, like `row_hashes`."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    hashes = np.zeros(table.num_rows, dtype=np.uint64)
+    for column, values in zip(table.column_names, table.columns):
+        values = values.combine_chunks()
+        if not pa.types.is_dictionary(values.type):
+            values = pc.dictionary_encode(values)
+        # Hash each distinct value once.
+        value_hashes = pd.util.hash_array(
+            values.dictionary.to_numpy(zero_copy_only=False)
+        )
+        indices = values.indices.fill_null(0).to_numpy()
+        cells = value_hashes[indices] ^ _salt(column)
+        cells[values.is_null().to_numpy(zero_copy_only=False)] = 0
+        hashes += cells
+    return hashes
+
+
+def _salt(column):
+    """Distinguish the same value in different columns."""
+    return np.uint64(zlib.crc32(str(column).encode()) * 0x9E3779B97F4A7C15 % 2**64)
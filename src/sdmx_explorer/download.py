@@ -2,18 +2,56 @@ import numpy as np
 import pandas as pd
 from rich.markup import escape
 import sdmx
+from sdmx.format import Version
+from sdmx.source import DataContentType
 import yaml
 
 import argparse
+from collections import Counter, defaultdict, deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import partial
+from itertools import islice
+import math
+import multiprocessing
 from pathlib import Path
 import random
+import threading
 import time
 import tomllib
+from urllib.parse import quote
 
-from .context import SdmxContext
+from .cache import load_cached, read_cached, upsert, write_cached
+from .context import SdmxContext, UnsupportedFormatError
+from .dedup import Deduplicator
 from .display import CONSOLE
+from .dtypes import VALUE_DTYPES, compact, concat, to_periods
+from .limit import RateLimiter, is_oversized, is_retryable, status_code
+from .manifest import Manifest
+from .parse import SDMX_CSV_TYPES, iter_data, parse_data, read_csv_data, read_data
 from .path import SdmxQuery
+from .plan import plan_batches, split_query, warm_up
+from .session import (
+    POOL_SIZE,
+    add_session_arguments,
+    cached_client,
+    client_from_arguments,
+    store_from_arguments,
+)
+from .sink import STREAMING_TABLE_EXTENSIONS, Spool, TableWriter, write_partitions
+from .store import StructureStore
+from .tables import (
+    ARROW_TABLE_EXTENSIONS,
+    ENGINES,
+    concat_tables,
+    constant,
+    save_table,
+    to_table,
+)
+from .transport import add_transport_arguments, client_like, transport_from_arguments
 
 
 def main():
@@ -29,7 +67,7 @@ def _main():
 
     parser = argparse.ArgumentParser(
         add_help=False,
-        usage="download [-v|--verbose] <DOWNLOAD_CONFIG_PATH>...",
+        usage="download [-v|--verbose] [-j|--jobs <JOBS>] [-r|--resume] [--no-http-cache] [--http-cache-ttl <RESOURCE_TYPE=SECONDS>] [--pool-size <CONNECTIONS>] [--connect-timeout <SECONDS>] [--read-timeout <SECONDS>] [--record <DIR> | --replay <PATH>] <DOWNLOAD_CONFIG_PATH>...",
     )
     parser.add_argument(
         "-v",
@@ -38,6 +76,22 @@ def _main():
         default=False,
         help="Output additional information for debugging purposes.",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Run this many queries at a time (overrides `concurrency`).",
+    )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Skip queries that were completed by a previous run.",
+    )
+    add_session_arguments(parser)
+    add_transport_arguments(parser)
     parser.add_argument(
         "-h",
         "--help",
@@ -53,6 +107,7 @@ def _main():
         help=argparse.SUPPRESS,
     )
     args = parser.parse_args()
+    adapter = transport_from_arguments(parser, args)
 
     # TODO: Actually fix the warning instead of suppressing it.
     if not args.verbose:
@@ -65,8 +120,14 @@ def _main():
         )
 
     try:
-        ctx = SdmxContext(client=sdmx.Client(), console=console)
         configs = [(path, DownloadConfig.load(path)) for path in args.paths]
+        # Keep a connection open for every query that can run at a time.
+        jobs = args.jobs or max(config.concurrency for _, config in configs)
+        ctx = SdmxContext(
+            client=client_from_arguments(args, adapter, pool_size=max(jobs, POOL_SIZE)),
+            console=console,
+            store=store_from_arguments(args, adapter),
+        )
 
         seen = set()
         for path, config in configs:
@@ -85,7 +146,9 @@ def _main():
                 f"[b]Starting download:[/] {escape(repr(str(path)))} -> {escape(repr(str(config.output_path)))}",
                 highlight=True,
             )
-            config.download(ctx=ctx, verbose=args.verbose)
+            config.download(
+                ctx=ctx, verbose=args.verbose, jobs=args.jobs, resume=args.resume
+            )
             console.rule()
     except Exception as err:
         if args.verbose:
@@ -103,7 +166,26 @@ class DownloadConfig:
     drop_attributes: bool = False
     pivot_table: bool = False
     use_cache: bool = True
+    cache_ttl: int = 0
+    source_cache_ttls: dict[str, int] = field(default_factory=dict)
+    incremental: bool = False
+    incremental_param: str = "updatedAfter"
     max_retries: int = 4
+    concurrency: int = 1
+    max_source_concurrency: int = 4
+    coalesce_queries: bool = False
+    max_key_length: int = 1000
+    split_queries: bool = False
+    rate_limits: dict[str, float] = field(default_factory=dict)
+    stream_output: bool = False
+    parse_processes: int = 0
+    stream_parse: bool = False
+    data_format: str = "sdmx-ml"
+    compact_dtypes: bool = False
+    value_dtype: str = "float64"
+    engine: str = "pandas"
+    partitioned: bool = False
+    partition_by: list[str] = field(default_factory=list)
 
     REQUIRED_FIELDS = ["output_path", "queries"]
     EXPECTED_FIELDS = {
@@ -113,8 +195,29 @@ class DownloadConfig:
         "drop_attributes": bool,
         "pivot_table": bool,
         "use_cache": bool,
+        "cache_ttl": int,
+        "source_cache_ttls": dict,
+        "incremental": bool,
+        "incremental_param": str,
         "max_retries": int,
+        "concurrency": int,
+        "max_source_concurrency": int,
+        "coalesce_queries": bool,
+        "max_key_length": int,
+        "split_queries": bool,
+        "rate_limits": dict,
+        "stream_output": bool,
+        "parse_processes": int,
+        "stream_parse": bool,
+        "data_format": str,
+        "compact_dtypes": bool,
+        "value_dtype": str,
+        "engine": str,
+        "partitioned": bool,
+        "partition_by": list,
     }
+    INCREMENTAL_PARAMS = {"updatedAfter", "startPeriod"}
+    DATA_FORMATS = {"sdmx-ml", "sdmx-csv"}
     SUPPORTED_TABLE_EXTENSIONS = {
         ".tsv",
         ".csv",
@@ -129,6 +232,8 @@ class DownloadConfig:
         ".tex",
         ".dta",
     }
+    # Extensions of formats that can store `TIME_PERIOD` as a period.
+    PERIOD_TABLE_EXTENSIONS = {".parquet", ".feather", ".pkl", ".pickle"}
 
     @classmethod
     def load(cls, path: Path) -> "DownloadConfig":
@@ -164,11 +269,48 @@ class DownloadConfig:
 
         # Parse string values.
         data["output_path"] = path.parent / data["output_path"]
-        if data["output_path"].suffix not in cls.SUPPORTED_TABLE_EXTENSIONS:
+        if data.get("partitioned", False):
+            cls._check_partitioned(path, data)
+        elif data.get("partition_by"):
+            raise ValueError(
+                f"Download configuration file {str(path)!r} cannot use 'partition_by' without 'partitioned'"
+            )
+        elif data["output_path"].suffix not in cls.SUPPORTED_TABLE_EXTENSIONS:
             raise TypeError(
                 f"Download configuration file {str(path)!r} output path {str(data['output_path'])!r} has an unsupported file extension for tabular data: {data['output_path'].suffix!r}"
             )
-        if data["output_path"].is_dir():
+        if (
+            data.get("stream_output", False)
+            and data["output_path"].suffix not in STREAMING_TABLE_EXTENSIONS
+        ):
+            raise TypeError(
+                f"Download configuration file {str(path)!r} output path {str(data['output_path'])!r} has an unsupported file extension for streaming output: {data['output_path'].suffix!r}"
+            )
+        if data.get("stream_output", False) and data.get("pivot_table", False):
+            raise ValueError(
+                f"Download configuration file {str(path)!r} cannot use both 'stream_output' and 'pivot_table'"
+            )
+        if data.get("incremental", False) and not data.get("use_cache", True):
+            raise ValueError(
+                f"Download configuration file {str(path)!r} cannot use 'incremental' without 'use_cache'"
+            )
+        if data.get("incremental_param", "updatedAfter") not in cls.INCREMENTAL_PARAMS:
+            raise ValueError(
+                f"Download configuration file {str(path)!r} field 'incremental_param' has an unsupported value: {data['incremental_param']!r} (should be one of {sorted(cls.INCREMENTAL_PARAMS)})"
+            )
+        if data.get("data_format", "sdmx-ml") not in cls.DATA_FORMATS:
+            raise ValueError(
+                f"Download configuration file {str(path)!r} field 'data_format' has an unsupported value: {data['data_format']!r} (should be one of {sorted(cls.DATA_FORMATS)})"
+            )
+        if data.get("value_dtype", "float64") not in VALUE_DTYPES:
+            raise ValueError(
+                f"Download configuration file {str(path)!r} field 'value_dtype' has an unsupported value: {data['value_dtype']!r} (should be one of {sorted(VALUE_DTYPES)})"
+            )
+        if data.get("engine", "pandas") not in ENGINES:
+            raise ValueError(
+                f"Download configuration file {str(path)!r} field 'engine' has an unsupported value: {data['engine']!r} (should be one of {sorted(ENGINES)})"
+            )
+        if data["output_path"].is_dir() and not data.get("partitioned", False):
             raise IsADirectoryError(
                 f"Download configuration file {str(path)!r} output path {str(data['output_path'])!r} already exists as a directory"
             )
@@ -181,158 +323,998 @@ class DownloadConfig:
                     f"Download configuration file {str(path)!r} query {query!r} is invalid: {err}"
                 )
         data["queries"] = queries
+        for key in ["rate_limits", "source_cache_ttls"]:
+            for source, value in data.get(key, {}).items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise TypeError(
+                        f"Download configuration file {str(path)!r} field {key!r} value for source {source!r} has the wrong type: {type(value).__name__!r} (should be 'float')"
+                    )
+        for source, rate in data.get("rate_limits", {}).items():
+            if rate <= 0:
+                raise ValueError(
+                    f"Download configuration file {str(path)!r} rate limit for source {source!r} is not positive: {rate!r}"
+                )
 
         return cls(**data)
 
-    def download(self, ctx=None, verbose=False):
+    @classmethod
+    def _check_partitioned(cls, path: Path, data: dict):
+        """Verify the fields of a download configuration with a partitioned output."""
+        if data["output_path"].is_file():
+            raise FileExistsError(
+                f"Download configuration file {str(path)!r} output path {str(data['output_path'])!r} already exists as a file (should be a directory with 'partitioned')"
+            )
+        if data.get("stream_output", False):
+            raise ValueError(
+                f"Download configuration file {str(path)!r} cannot use both 'stream_output' and 'partitioned'"
+            )
+        for column in data.get("partition_by", []):
+            if not isinstance(column, str):
+                raise TypeError(
+                    f"Download configuration file {str(path)!r} field 'partition_by' value {column!r} has the wrong type: {type(column).__name__!r} (should be 'str')"
+                )
+            unsupported = {"SOURCE_ID", "DATAFLOW_ID", "value"}
+            if data.get("pivot_table", False):
+                unsupported.add("TIME_PERIOD")
+            if column in unsupported:
+                raise ValueError(
+                    f"Download configuration file {str(path)!r} cannot partition by column {column!r}"
+                )
+
+    def download(self, ctx=None, verbose=False, jobs=None, resume=False):
+        if jobs is None:
+            jobs = self.concurrency
         if ctx is None:
-            ctx = SdmxContext(client=sdmx.Client(), console=CONSOLE)
+            ctx = SdmxContext(
+                client=cached_client(pool_size=max(jobs, POOL_SIZE)),
+                console=CONSOLE,
+                store=StructureStore(),
+            )
+
+        # Only this download is summarized, even if the context was used before.
+        stats_before = ctx.stats.copy()
+
+        # Record each completed query so that an interrupted download can be resumed.
+        manifest = None
+        manifest_path = Manifest.path_for(self.output_path)
+        if self.use_cache:
+            manifest = (
+                Manifest.load(manifest_path) if resume else Manifest(manifest_path)
+            )
+        elif resume:
+            ctx.console.print(
+                f"[warning]Warning:[/] Cannot resume download to {escape(repr(str(self.output_path)))} without 'use_cache'",
+                highlight=True,
+            )
+
+        # Parse data messages in other processes so that they don't hold up requests.
+        pool = nullcontext()
+        if self.parse_processes > 0:
+            pool = ProcessPoolExecutor(
+                max_workers=self.parse_processes,
+                # Forking a process with running threads is unsafe.
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        with pool:
+            limiter = RateLimiter(self.rate_limits)
+            run = partial(
+                self._run,
+                console=ctx.console,
+                verbose=verbose,
+                manifest=manifest,
+                pool=None if isinstance(pool, nullcontext) else pool,
+                # Sources found not to support SDMX-CSV during this download.
+                csv_unsupported=set(),
+            )
+            # Drop duplicate rows as each query result arrives.
+            dedup = Deduplicator()
+            results = (
+                (
+                    query,
+                    df if df is None else self._drop_duplicates(ctx, dedup, query, df),
+                )
+                for query, df in zip(
+                    self.queries,
+                    self._results(ctx, jobs, limiter, run, manifest=manifest),
+                )
+            )
+            if self.partitioned:
+                rows = self._save_partitioned(ctx, results)
+            elif self.stream_output:
+                rows = self._save_stream(
+                    ctx, (df for _, df in results if df is not None)
+                )
+            else:
+                download = [df for _, df in results if df is not None]
+                with ctx.stats.time(None, "save"):
+                    rows = self._save(ctx, download)
 
-        download = []
-        for query in self.queries:
-            query_str = query.to_str(rich=True)
+        table = ctx.stats.since(stats_before).table()
+        if table.row_count:
+            ctx.console.print(table)
+        if rows:
+            ctx.console.print(
+                f"[b]Finished download:[/] Saved {rows} rows to {escape(repr(str(self.output_path)))}",
+                highlight=True,
+            )
+        else:
+            ctx.console.print(
+                f"[warning]Warning:[/] Nothing to save to {escape(repr(str(self.output_path)))}",
+                highlight=True,
+            )
+
+    def _save(self, ctx, download):
+        """Save the combined download to the output path."""
+        if not download:
+            return 0
+        if self.engine == "arrow" and not self.pivot_table:
+            return self._save_table(ctx, download)
+
+        df = self._combine(download)
+        self._warn_missing_columns(ctx, df.columns)
+        df = self._select_columns(df)
+
+        # Save to output path.
+        save_as(df, self.output_path)
+        return len(df)
+
+    def _combine(self, download):
+        """Combine query results into a single table."""
+        if self.engine == "arrow":
+            df = concat_tables(download).to_pandas()
+        elif self.compact_dtypes:
+            df = concat(download)
+        else:
+            df = pd.concat(download, ignore_index=True)
+
+        # Pivot table so each row is an entire time series.
+        if self.pivot_table:
+            df = pivot(df)
+        elif (
+            self.compact_dtypes
+            and self.engine == "pandas"
+            and self.output_path.suffix in self.PERIOD_TABLE_EXTENSIONS
+            and "TIME_PERIOD" in df.columns
+        ):
+            periods = to_periods(df["TIME_PERIOD"])
+            if periods is not None:
+                df["TIME_PERIOD"] = periods
+        return df
+
+    def _save_table(self, ctx, download):
+        """Save the combined download to the output path, without leaving Arrow if possible."""
+        table = concat_tables(download)
+        self._warn_missing_columns(ctx, table.column_names)
+        table = self._select_columns(table)
+
+        # Save to output path.
+        if self.output_path.suffix in ARROW_TABLE_EXTENSIONS:
+            save_table(table, self.output_path)
+        else:
+            save_as(table.to_pandas(), self.output_path)
+        return table.num_rows
+
+    def _save_stream(self, ctx, results):
+        """Save each query result to the output path as it arrives."""
+        seen_columns = set()
+        with TableWriter(self.output_path) as writer:
+            for result in results:
+                # A query result can also be read back one chunk at a time.
+                chunks = result if isinstance(result, Iterator) else [result]
+                for df in chunks:
+                    if not isinstance(df, pd.DataFrame):
+                        with ctx.stats.time(None, "to_pandas"):
+                            df = df.to_pandas()
+                    seen_columns.update(df.columns)
+                    with ctx.stats.time(None, "save"):
+                        writer.append(self._select_columns(df))
+
+        self._warn_missing_columns(ctx, seen_columns)
+        return writer.rows
+
+    def _save_partitioned(self, ctx, results):
+        """Save each partition of the download to the output directory once its queries finish."""
+        # Results arrive in query order, so a partition is finished after its last query.
+        remaining = Counter((query.source, query.dataflow) for query in self.queries)
+        pending = defaultdict(list)
+        seen_columns = set()
+        rows = 0
+        written = 0
+        for query, df in results:
+            key = (query.source, query.dataflow)
+            if df is not None:
+                pending[key].append(df)
+            remaining[key] -= 1
+            if remaining[key] or key not in pending:
+                continue
+
+            source, dataflow = key
+            with ctx.stats.time(source, "save"):
+                df = self._combine(pending.pop(key))
+                seen_columns.update(df.columns)
+                # The source and dataflow are stored in the directory names instead.
+                df = self._select_columns(df).drop(
+                    columns=["SOURCE_ID", "DATAFLOW_ID"], errors="ignore"
+                )
+
+                directory = (
+                    self.output_path
+                    / f"SOURCE_ID={quote(source, safe='')}"
+                    / f"DATAFLOW_ID={quote(dataflow, safe='')}"
+                )
+                written += write_partitions(directory, df, self.partition_by)
+            rows += len(df)
+
+        self._warn_missing_columns(ctx, seen_columns)
+        if rows:
+            ctx.console.print(
+                f"Wrote {written} partition files to {escape(repr(str(self.output_path)))} (the others are unchanged)",
+                highlight=True,
+            )
+        return rows
+
+    def _drop_duplicates(self, ctx, dedup, query, df):
+        """Drop rows that were already received, from the same query or an earlier one."""
+        if isinstance(df, Iterator):
+            return self._drop_duplicate_chunks(ctx, dedup, query, df)
+        with ctx.stats.time(query.source, "process"):
+            df, overlapping = dedup.drop(df)
+        self._warn_overlapping(ctx, query, overlapping)
+        return df
+
+    def _drop_duplicate_chunks(self, ctx, dedup, query, chunks):
+        """Drop duplicate rows like `_drop_duplicates`, from each chunk as it's read."""
+        overlapping = 0
+        for df in chunks:
+            with ctx.stats.time(query.source, "process"):
+                df, dropped = dedup.drop(df)
+            overlapping += dropped
+            yield df
+        self._warn_overlapping(ctx, query, overlapping)
+
+    def _warn_overlapping(self, ctx, query, overlapping):
+        if overlapping:
+            ctx.console.print(
+                f"[warning]Warning:[/] Dropped {overlapping} rows from {query.to_str(rich=True)} that were already received from overlapping queries",
+                highlight=True,
+            )
+
+    def _select_columns(self, df):
+        # Rearrange so that source and dataflow are the first two columns.
+        PREFIX_COLS = ["SOURCE_ID", "DATAFLOW_ID"]
+        if not isinstance(df, pd.DataFrame):
+            other_cols = [x for x in df.column_names if x not in PREFIX_COLS]
+            return df.select(
+                [x for x in PREFIX_COLS + other_cols if x not in self.drop_columns]
+            )
+        other_cols = [x for x in df.columns if x not in PREFIX_COLS]
+        df = df[PREFIX_COLS + other_cols]
+
+        # Drop unwanted columns.
+        return df.drop(columns=self.drop_columns, errors="ignore")
+
+    def _warn_missing_columns(self, ctx, columns):
+        for column in self.drop_columns:
+            if column not in columns:
+                ctx.console.print(
+                    f"[warning]Warning:[/] Cannot drop column {escape(repr(column))} that is already missing",
+                    highlight=True,
+                )
+
+    def cache_ttl_for(self, source_id: str) -> float:
+        """Get the number of seconds that cached query results from a source stay fresh."""
+        return self.source_cache_ttls.get(source_id, self.cache_ttl)
+
+    def _results(self, ctx, jobs, limiter, run, manifest=None):
+        """Yield the result of each query in order, running up to `jobs` batches at a time."""
+        console = ctx.console
+        batches = plan_batches(
+            self.queries,
+            coalesce=self.coalesce_queries,
+            max_key_length=self.max_key_length,
+        )
+        if jobs <= 1:
+            old_limiter = ctx.limiter
+            ctx.limiter = limiter
             try:
-                with ctx.console.status(f"{query_str}"):
-                    try:
-                        ctx.select_source(query.source)
-                    except KeyError:
-                        ctx.console.print(
-                            f"[error]Error:[/] No source found with ID {escape(repr(query.source))} in {query_str}",
-                            highlight=True,
-                        )
-                        continue
+                yield from _in_query_order(
+                    batches, (run(ctx, batch) for batch in batches)
+                )
+            finally:
+                ctx.limiter = old_limiter
+            return
 
-                    try:
-                        ctx.select_dataflow(query.dataflow)
-                    except KeyError:
-                        ctx.console.print(
-                            f"[error]Error:[/] No dataflow found with ID {escape(repr(query.dataflow))} in {query_str}",
-                            highlight=True,
-                        )
-                        continue
+        # Each worker thread gets its own context, and each source gets its own cap.
+        local = threading.local()
+        source_limits = {
+            query.source: threading.BoundedSemaphore(
+                max(self.max_source_concurrency, 1)
+            )
+            for query in self.queries
+        }
+
+        def context():
+            if not hasattr(local, "ctx"):
+                local.ctx = SdmxContext(
+                    client=client_like(ctx.client),
+                    limiter=limiter,
+                    store=ctx.store,
+                    stats=ctx.stats,
+                )
+            return local.ctx
+
+        def run_local(batch):
+            source_limit = source_limits[batch.queries[0].source]
+            with source_limit:
+                return run(context(), batch, source_limit=source_limit)
+
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        try:
+            # Resolve every structure up front instead of one query at a time.
+            queries = [
+                query for query in self.queries if not self._loadable(query, manifest)
+            ]
+            if queries:
+                with console.status(f"Requesting structures with {jobs} jobs"):
+                    warm_up(executor, context, queries, source_limits)
+
+            with console.status(
+                f"Downloading {len(self.queries)} queries with {jobs} jobs"
+            ) as status:
+                done = 0
+
+                def on_done(size, future):
+                    nonlocal done
+                    done += size
+                    status.update(
+                        f"Downloading {len(self.queries)} queries with {jobs} jobs ({done} done)"
+                    )
+
+                def submit(batch):
+                    future = executor.submit(run_local, batch)
+                    future.add_done_callback(partial(on_done, len(batch.queries)))
+                    return future
+
+                def in_order():
+                    # Only keep a few batches in flight, so that workers don't run far
+                    # ahead of the output and results are freed once they're yielded.
+                    remaining = iter(batches)
+                    futures = deque(map(submit, islice(remaining, 2 * jobs)))
+                    while futures:
+                        result = futures.popleft().result()
+                        futures.extend(map(submit, islice(remaining, 1)))
+                        yield result
+                        del result
+
+                # Yield in query order so that the output matches a serial run.
+                yield from _in_query_order(batches, in_order())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run(
+        self,
+        ctx,
+        batch,
+        console,
+        verbose=False,
+        manifest=None,
+        pool=None,
+        csv_unsupported=None,
+        source_limit=None,
+    ):
+        """Run a batch of queries and return the processed result of each one (or `None`).
+
+        `source_limit` is the semaphore that this batch holds a slot of, if any, which
+        the queries that an oversized query is split into are also limited by.
+        """
+        loaded = [None] * len(batch.queries)
+        try:
+            for i, query in enumerate(batch.queries):
+                ctx.stats.add(query.source, "queries")
+                with ctx.stats.time(query.source, "cache"):
+                    loaded[i] = self._load(query, console, manifest)
+                if loaded[i] is not None:
+                    ctx.stats.add(query.source, "hits")
+
+            pending = [i for i, x in enumerate(loaded) if x is None]
+            previous = {}
+            if self.incremental:
+                previous = {i: self._previous(batch.queries[i]) for i in pending}
+
+            # Request every query that couldn't be loaded from disk at once.
+            fetched = {}
+            if len(pending) > 1:
+                try:
+                    fetched = self._fetch_merged(
+                        ctx,
+                        batch,
+                        pending,
+                        previous,
+                        console,
+                        verbose,
+                        pool=pool,
+                        csv_unsupported=csv_unsupported,
+                        source_limit=source_limit,
+                    )
+                except Exception as err:
+                    # So that one bad query doesn't fail the others.
+                    console.print(
+                        f"[warning]Warning:[/] {escape(repr(err))} while requesting {batch.merge([batch.queries[i] for i in pending]).to_str(rich=True)}, requesting its {len(pending)} queries one at a time",
+                        highlight=True,
+                    )
+                    if verbose:
+                        console.print_exception(show_locals=True)
+            for i in pending:
+                if i not in fetched:
+                    fetched[i] = self._fetch(
+                        ctx,
+                        batch.queries[i],
+                        console,
+                        verbose,
+                        params=self._incremental_params([previous.get(i)]),
+                        pool=pool,
+                        csv_unsupported=csv_unsupported,
+                        source_limit=source_limit,
+                        # Results that are merged into the last one need to be whole.
+                        chunked=previous.get(i) is None,
+                    )
+                if fetched[i] is None:
+                    continue
+                part, dimensions, url = fetched[i]
+                new_rows = None
+                if previous.get(i) is not None:
+                    # Merge the new or revised observations into the last result.
+                    last, _ = previous[i]
+                    new_rows = 0 if part is None else len(part)
+                    part = last if part is None else upsert(last, part, dimensions)
+                loaded[i] = self._save_cached(
+                    batch.queries[i],
+                    part,
+                    dimensions,
+                    url,
+                    console,
+                    manifest,
+                    new_rows=new_rows,
+                )
+        except Exception as err:
+            console.print(
+                f"[error]Error:[/] {escape(repr(err))} while requesting {batch.merge().to_str(rich=True)}",
+                highlight=True,
+            )
+            if verbose:
+                console.print_exception(show_locals=True)
+
+        processed = []
+        for query, x in zip(batch.queries, loaded):
+            with ctx.stats.time(query.source, "process"):
+                df = self._process(query, x)
+            if df is not None:
+                ctx.stats.add(query.source, "rows", len(x[0]))
+            processed.append(df)
+        return processed
+
+    def _loadable(self, query, manifest=None):
+        """Check whether a query result can be loaded from disk without any requests."""
+        if manifest is not None and manifest.completed(query) is not None:
+            return True
+        return (
+            self.use_cache
+            and load_cached(query, self.cache_ttl_for(query.source)) is not None
+        )
+
+    def _load(self, query, console, manifest=None):
+        """Load a query result and its dimension IDs from disk, if possible."""
+        query_str = query.to_str(rich=True)
+        entry = None if manifest is None else manifest.completed(query)
+        if entry is not None:
+            if entry.path is None:
+                console.print(f"[warning]Warning:[/] No results for {query_str}")
+                return None, entry.dimensions
+
+            # Load the query result from the previous run.
+            df = read_cached(Path(entry.path))
+            console.print(f"Resumed {len(df)} rows from {query_str}", highlight=True)
+            return df, entry.dimensions
+
+        cached = None
+        if self.use_cache:
+            cached = load_cached(query, self.cache_ttl_for(query.source))
+        if cached is not None:
+            # Load the query result from the cache without any requests.
+            df = read_cached(Path(cached.path))
+            if manifest is not None:
+                manifest.record(
+                    query,
+                    rows=len(df),
+                    path=Path(cached.path),
+                    dimensions=cached.dimensions,
+                )
+            console.print(
+                f"Loaded {len(df)} cached rows from {query_str}", highlight=True
+            )
+            return df, cached.dimensions
+
+    def _previous(self, query):
+        """Load the last result of a query and its fetch time, regardless of its age."""
+        cached = load_cached(query, math.inf)
+        if cached is None:
+            return None
+        return read_cached(Path(cached.path)), datetime.fromisoformat(cached.fetched_at)
+
+    def _incremental_params(self, previous):
+        """Get the query parameters to request only what changed since `previous`."""
+        # Every query in a merged request needs to be up to date.
+        previous = list(previous)
+        if not previous or any(x is None for x in previous):
+            return None
+        match self.incremental_param:
+            case "updatedAfter":
+                fetched_at = min(fetched_at for _, fetched_at in previous)
+                value = fetched_at.astimezone(timezone.utc).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                )
+            case "startPeriod":
+                # The latest period is requested again in case it was revised.
+                if any(
+                    "TIME_PERIOD" not in df.columns or df.empty for df, _ in previous
+                ):
+                    return None
+                value = min(df["TIME_PERIOD"].max() for df, _ in previous)
+        return {self.incremental_param: value}
+
+    def _fetch_merged(
+        self,
+        ctx,
+        batch,
+        pending,
+        previous,
+        console,
+        verbose=False,
+        pool=None,
+        csv_unsupported=None,
+        source_limit=None,
+    ):
+        """Request some queries of a batch at once and split the result back into each query.
+
+        Raises an exception if the merged request fails.
+        """
+        df, dimensions, url = self._fetch(
+            ctx,
+            batch.merge([batch.queries[i] for i in pending]),
+            console,
+            verbose,
+            params=self._incremental_params(previous.get(i) for i in pending),
+            pool=pool,
+            csv_unsupported=csv_unsupported,
+            source_limit=source_limit,
+            raise_errors=True,
+        )
+        dimension = ctx.key_dimensions()[batch.position].id
+        fetched = {}
+        for i in pending:
+            part = df
+            if df is not None:
+                part = df[df[dimension].isin(batch.codes(batch.queries[i]))]
+                part = part.reset_index(drop=True)
+            fetched[i] = (part, dimensions, url)
+        return fetched
+
+    def _fetch(
+        self,
+        ctx,
+        query,
+        console,
+        verbose=False,
+        params=None,
+        pool=None,
+        csv_unsupported=None,
+        split_depth=0,
+        source_limit=None,
+        raise_errors=False,
+        chunked=False,
+    ):
+        """Request a query and return its result, its dimension IDs, and its URL.
+
+        Errors are printed and `None` is returned, unless `raise_errors` is true. If
+        `chunked` is true, the result can be a `Spool` of chunks (see `_request_data`).
+        """
+        query_str = query.to_str(rich=True)
+        attempt = 0
+        attempts = max(self.max_retries, 0) + 1
+        try:
+            status = (
+                nullcontext() if ctx.console is None else ctx.console.status(query_str)
+            )
+            with status:
+                try:
+                    ctx.select_source(query.source)
+                except KeyError:
+                    if raise_errors:
+                        raise
+                    console.print(
+                        f"[error]Error:[/] No source found with ID {escape(repr(query.source))} in {query_str}",
+                        highlight=True,
+                    )
+                    return
+
+                try:
+                    ctx.select_dataflow(query.dataflow)
+                except KeyError:
+                    if raise_errors:
+                        raise
+                    console.print(
+                        f"[error]Error:[/] No dataflow found with ID {escape(repr(query.dataflow))} in {query_str}",
+                        highlight=True,
+                    )
+                    return
+
+                try:
+                    ctx.select_key(query.key)
+                except KeyError as err:
+                    if raise_errors:
+                        raise
+                    console.print(
+                        f"[error]Error:[/] No code found with ID {escape(str(err))} in {query_str}",
+                        highlight=True,
+                    )
+                    return
+                except ValueError as err:
+                    if raise_errors:
+                        raise
+                    console.print(
+                        f"[error]Error:[/] {escape(str(err))} in {query_str}",
+                        highlight=True,
+                    )
+                    return
 
+                kwargs = {"params": params} if params else {}
+                dimensions = [x.id for x in ctx.dimensions()]
+                delay = 0.5
+                max_delay = 4
+                for attempt in range(attempts):
                     try:
-                        ctx.select_key(query.key)
-                    except KeyError as err:
-                        ctx.console.print(
-                            f"[error]Error:[/] No code found with ID {escape(str(err))} in {query_str}",
-                            highlight=True,
+                        df = self._request_data(
+                            ctx,
+                            kwargs,
+                            dimensions,
+                            console,
+                            pool,
+                            csv_unsupported,
+                            chunked=chunked,
                         )
-                        continue
-                    except ValueError as err:
-                        ctx.console.print(
-                            f"[error]Error:[/] {escape(str(err))} in {query_str}",
-                            highlight=True,
-                        )
-                        continue
-
-                    delay = 0.5
-                    max_delay = 4
-                    attempts = max(self.max_retries, 0) + 1
-                    for attempt in range(attempts):
-                        try:
-                            df: pd.DataFrame = ctx.data()
+                        ctx.limiter.success(query.source)
+                        break
+                    except Exception as err:
+                        # Throttling is shared by every query against the same source.
+                        server_delay = ctx.limiter.failure(query.source, err)
+                        if status_code(err) == 404 and (split_depth or params):
+                            # SDMX 2.1 sources respond to queries with no results with
+                            # HTTP 404: here, part of a split query that happens to have
+                            # no data, or an incremental query with nothing new.
+                            df = None
                             break
-                        except Exception as err:
-                            if attempt + 1 == attempts:
-                                raise
-                            ctx.console.print(
-                                f"[warning]Warning:[/] {escape(repr(err))} while requesting {query_str} (attempt {attempt + 1}/{attempts})",
+                        subqueries = []
+                        if self.split_queries and is_oversized(err):
+                            subqueries = self._split(ctx, query)
+                        if subqueries:
+                            console.print(
+                                f"[warning]Warning:[/] {escape(repr(err))} while requesting {query_str}, splitting it into {len(subqueries)} smaller queries",
                                 highlight=True,
                             )
+                            df = self._fetch_split(
+                                ctx,
+                                subqueries,
+                                console,
+                                verbose,
+                                params=params,
+                                pool=pool,
+                                csv_unsupported=csv_unsupported,
+                                split_depth=split_depth + 1,
+                                source_limit=source_limit,
+                            )
+                            break
+                        if attempt + 1 == attempts or not is_retryable(err):
+                            raise
+                        console.print(
+                            f"[warning]Warning:[/] {escape(repr(err))} while requesting {query_str} (attempt {attempt + 1}/{attempts})",
+                            highlight=True,
+                        )
+                        ctx.stats.add(query.source, "retries")
+                        # Otherwise the limiter waits out the server's `Retry-After`.
+                        if server_delay is None:
                             time.sleep(random.uniform(0, delay))
-                            delay = min(2 * delay, max_delay)
+                        delay = min(2 * delay, max_delay)
 
-                if df is None:
-                    ctx.console.print(
-                        f"[warning]Warning:[/] No results for {query_str}"
-                    )
+            # Drop empty observations (already dropped from each chunk of a `Spool`).
+            if isinstance(df, pd.DataFrame):
+                df = df.dropna(subset="value")
+
+            return df, dimensions, ctx.url()
+        except Exception as err:
+            if raise_errors:
+                raise
+            console.print(
+                f"[error]Error:[/] {escape(repr(err))} while requesting {query_str} (attempt {attempt + 1}/{attempts})",
+                highlight=True,
+            )
+            if verbose:
+                console.print_exception(show_locals=True)
+
+    def _split(self, ctx, query):
+        """Split the selected query into smaller queries along the dimension with the most codes."""
+        best = None
+        for position, (part, dimension) in enumerate(
+            zip(query.key.split("."), ctx.key_dimensions())
+        ):
+            if part == "*":
+                try:
+                    codes = [code.id for code in ctx.codes(dimension)]
+                except ValueError:
+                    # The dimension has no codelist.
                     continue
+            else:
+                codes = part.split("+")
+            if len(codes) > 1 and (best is None or len(codes) > len(best[1])):
+                best = (position, codes)
+        if best is None:
+            return []
+        position, codes = best
+        return split_query(query, position, codes, max_key_length=self.max_key_length)
 
-                # Drop empty observations.
-                df = df.dropna(subset="value")
+    def _fetch_split(
+        self,
+        ctx,
+        subqueries,
+        console,
+        verbose=False,
+        params=None,
+        pool=None,
+        csv_unsupported=None,
+        split_depth=1,
+        source_limit=None,
+    ):
+        """Request the queries that an oversized query was split into and combine their results.
 
-                # Cache the query result.
-                if self.use_cache:
-                    save_as(df, cache_path(query))
+        If the query holds a slot of `source_limit`, each smaller query takes a slot of
+        its own instead, so that splitting never exceeds `max_source_concurrency`.
+        """
+        local = threading.local()
 
-                ctx.console.print(
-                    f"Received {len(df)} rows from {query_str}", highlight=True
+        def fetch(subquery):
+            if not hasattr(local, "ctx"):
+                local.ctx = SdmxContext(
+                    client=client_like(ctx.client),
+                    limiter=ctx.limiter,
+                    store=ctx.store,
+                    stats=ctx.stats,
                 )
-
-                # Drop attribute columns.
-                if self.drop_attributes:
-                    dimensions = set(x.id for x in ctx.dimensions())
-                    measures = {"value"}
-                    attributes = set(df.columns) - dimensions - measures
-                    df = df.drop(columns=attributes)
-
-                # Add columns for the SDMX source and dataflow.
-                df.insert(0, "SOURCE_ID", query.source)
-                df.insert(1, "DATAFLOW_ID", query.dataflow)
-
-                # Add query result to download.
-                download.append(df)
-            except Exception as err:
-                attempts = max(self.max_retries, 0) + 1
-                ctx.console.print(
-                    f"[error]Error:[/] {escape(repr(err))} while requesting {query_str} (attempt {attempts}/{attempts})",
-                    highlight=True,
+            with nullcontext() if source_limit is None else source_limit:
+                fetched = self._fetch(
+                    local.ctx,
+                    subquery,
+                    console,
+                    verbose,
+                    params=params,
+                    pool=pool,
+                    csv_unsupported=csv_unsupported,
+                    split_depth=split_depth,
+                    source_limit=source_limit,
                 )
-                if verbose:
-                    ctx.console.print_exception(show_locals=True)
-
-        # Save the combined download to the output path.
-        if download:
-            df = pd.concat(download, ignore_index=True).drop_duplicates()
-
-            # Pivot table so each row is an entire time series.
-            if self.pivot_table:
-                df = pivot(df)
-
-            # Rearrange so that source and dataflow are the first two columns.
-            PREFIX_COLS = ["SOURCE_ID", "DATAFLOW_ID"]
-            other_cols = [x for x in df.columns if x not in PREFIX_COLS]
-            df = df[PREFIX_COLS + other_cols]
-
-            # Drop unwanted columns.
-            for column in self.drop_columns:
-                if column not in df.columns:
-                    ctx.console.print(
-                        f"[warning]Warning:[/] Cannot drop column {escape(repr(column))} that is already missing",
+            if fetched is None:
+                raise RuntimeError(f"Failed to request {subquery}")
+            return fetched[0]
+
+        # Only the first split runs in parallel, so that the number of threads doesn't
+        # multiply with each split.
+        jobs = max(self.max_source_concurrency, 1) if split_depth == 1 else 1
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        if source_limit is not None:
+            # Give up the slot of the original query while waiting for the smaller ones.
+            source_limit.release()
+        try:
+            frames = [df for df in executor.map(fetch, subqueries) if df is not None]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            if source_limit is not None:
+                source_limit.acquire()
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def _request_data(
+        self,
+        ctx,
+        kwargs,
+        dimensions,
+        console,
+        pool=None,
+        csv_unsupported=None,
+        chunked=False,
+    ):
+        """Request the data of the selected query and convert it to a table.
+
+        If `chunked` is true and each chunk of the table would be written to the output
+        as it's parsed anyway, the chunks are spilled to a `Spool` instead of being
+        combined, so that the whole table is never in memory.
+        """
+        source = ctx.client.source
+        measure = self._measure(ctx)
+        if (
+            self.data_format == "sdmx-csv"
+            and source.data_content_type is not DataContentType.JSON
+            and source.id not in (csv_unsupported or ())
+        ):
+            accept = SDMX_CSV_TYPES[
+                "3.0.0" if source.versions == {Version["3.0.0"]} else "2.1"
+            ]
+            try:
+                if pool is not None:
+                    content = ctx.get_data_content(accept=accept, **kwargs)
+                    with ctx.stats.time(source.id, "parse"):
+                        return pool.submit(
+                            parse_data,
+                            content,
+                            dimensions=dimensions,
+                            measure=measure,
+                            csv=True,
+                        ).result()
+                content = ctx.get_data_content(stream=True, accept=accept, **kwargs)
+                with ctx.stats.time(source.id, "parse"):
+                    return read_csv_data(
+                        content, dimensions=dimensions, measure=measure
+                    )
+            except UnsupportedFormatError:
+                # Fall back to SDMX-ML for this source from now on.
+                if csv_unsupported is not None and source.id not in csv_unsupported:
+                    csv_unsupported.add(source.id)
+                    console.print(
+                        f"[warning]Warning:[/] Source {escape(repr(source.id))} does not support SDMX-CSV, falling back to SDMX-ML",
                         highlight=True,
                     )
-            df = df.drop(columns=self.drop_columns, errors="ignore")
 
-            # Save to output path.
-            save_as(df, self.output_path)
-            ctx.console.print(
-                f"[b]Finished download:[/] Saved {len(df)} rows to {escape(repr(str(self.output_path)))}",
-                highlight=True,
-            )
+        if pool is not None:
+            content = ctx.get_data_content(**kwargs)
+            with ctx.stats.time(source.id, "parse"):
+                return pool.submit(
+                    parse_data,
+                    content,
+                    stream=self.stream_parse,
+                    dimensions=dimensions,
+                    measure=measure,
+                ).result()
+        if self.stream_parse:
+            # Parse the response as it arrives, without a full message.
+            content = ctx.get_data_content(stream=True, **kwargs)
+            with ctx.stats.time(source.id, "parse"):
+                if not (chunked and self.stream_output):
+                    return read_data(content, measure=measure)
+                self.output_path.parent.mkdir(parents=True, exist_ok=True)
+                spool = Spool(dir=self.output_path.parent)
+                for df in iter_data(content, measure=measure):
+                    spool.append(df.dropna(subset="value"))
+                return spool if len(spool) else None
+        return ctx.data(**kwargs)
+
+    @staticmethod
+    def _measure(ctx):
+        measures = ctx.measures()
+        return measures[0].id if measures else "OBS_VALUE"
+
+    def _save_cached(
+        self, query, df, dimensions, url, console, manifest=None, new_rows=None
+    ):
+        """Cache a query result that was just received."""
+        query_str = query.to_str(rich=True)
+        if df is None or not len(df):
+            if manifest is not None:
+                manifest.record(query, rows=0, dimensions=dimensions)
+            console.print(f"[warning]Warning:[/] No results for {query_str}")
+            return None, dimensions
+
+        if self.use_cache:
+            cached = write_cached(query, df, url=url, dimensions=dimensions)
+            if manifest is not None:
+                manifest.record(
+                    query,
+                    rows=len(df),
+                    path=Path(cached.path),
+                    dimensions=dimensions,
+                )
+
+        if new_rows is None:
+            console.print(f"Received {len(df)} rows from {query_str}", highlight=True)
         else:
-            ctx.console.print(
-                f"[warning]Warning:[/] Nothing to save to {escape(repr(str(self.output_path)))}",
+            console.print(
+                f"Received {new_rows} new or revised rows from {query_str} ({len(df)} rows in total)",
                 highlight=True,
             )
+        return df, dimensions
+
+    def _process(self, query, loaded):
+        """Prepare a query result to be combined with the rest of the download."""
+        if loaded is None:
+            return None
+        df, dimensions = loaded
+        if df is None:
+            return None
+        if isinstance(df, Spool):
+            # Process each chunk as it's read back.
+            return (self._process(query, (chunk, dimensions)) for chunk in df)
+
+        # Drop attribute columns.
+        if self.drop_attributes:
+            measures = {"value"}
+            attributes = set(df.columns) - set(dimensions) - measures
+            df = df.drop(columns=attributes)
+
+        if self.engine == "arrow":
+            if self.compact_dtypes:
+                df = compact(df, self.value_dtype)
+            table = to_table(df)
+            # Add columns for the SDMX source and dataflow.
+            table = table.add_column(
+                0, "SOURCE_ID", constant(query.source, table.num_rows)
+            )
+            table = table.add_column(
+                1, "DATAFLOW_ID", constant(query.dataflow, table.num_rows)
+            )
+            return table
+
+        # Add columns for the SDMX source and dataflow.
+        df.insert(0, "SOURCE_ID", query.source)
+        df.insert(1, "DATAFLOW_ID", query.dataflow)
+
+        if self.compact_dtypes:
+            df = compact(df, self.value_dtype)
+
+        return df
 
 
 def pivot(df: pd.DataFrame) -> pd.DataFrame:
-    """Pivot a table so that each row represents an entire time series."""
+    """Pivot a table so that each row represents an entire time series.
+
+    Every column other than the time period and value identifies a time series, and
+    missing values in those columns are kept as they are. Rows are sorted by those
+    columns (in their original order) and time periods are sorted after them. Values
+    with the same series and time period are averaged.
+    """
     TIME = "TIME_PERIOD"
     VALUE = "value"
-    NAN_MARKER = "__THIS_IS_NAN__"
-    return (
-        df.fillna(NAN_MARKER)
-        .pivot_table(
-            index=set(df.columns).difference([TIME, VALUE]),
-            columns=TIME,
-            values=VALUE,
-            # aggfunc='mean',
-        )
-        .reset_index()
-        .replace(NAN_MARKER, np.nan)
+    keys = [x for x in df.columns if x not in (TIME, VALUE)]
+    df = df[df[VALUE].notna()]
+
+    # Number each distinct time series, in order of first appearance.
+    series = np.zeros(len(df), dtype=np.int64)
+    for key in keys:
+        codes, uniques = pd.factorize(df[key], use_na_sentinel=False)
+        series, _ = pd.factorize(series * len(uniques) + codes)
+    periods, period_uniques = pd.factorize(df[TIME], sort=True)
+    n_series = series.max() + 1 if len(series) else 0
+    n_periods = len(period_uniques)
+
+    # Scatter the values into a (series, period) grid, averaging any duplicates.
+    cells = series * n_periods + periods
+    size = n_series * n_periods
+    values = df[VALUE].to_numpy(dtype=np.float64)
+    sums = np.bincount(cells, weights=values, minlength=size)
+    counts = np.bincount(cells, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grid = (sums / counts).reshape(n_series, n_periods)
+    if df[VALUE].dtype == np.float32:
+        grid = grid.astype(np.float32)
+
+    # Take the identifying columns from the first row of each series.
+    first = np.empty(n_series, dtype=np.int64)
+    first[series[::-1]] = np.arange(len(series) - 1, -1, -1)
+    result = pd.concat(
+        [
+            df[keys].iloc[first].reset_index(drop=True),
+            pd.DataFrame(grid, columns=pd.Index(period_uniques, name=TIME)),
+        ],
+        axis=1,
     )
+    if keys:
+        result = result.sort_values(keys, na_position="last", kind="stable")
+    return result.reset_index(drop=True)
 
 
 def save_as(df: pd.DataFrame, path: Path):
@@ -352,9 +1334,10 @@ def save_as(df: pd.DataFrame, path: Path):
         case ".parquet":
             df.to_parquet(path, index=False)
         case ".feather":
-            df.to_feather(path, index=False)
+            # Feather has no option to leave out the index, and can only store a default one.
+            df.reset_index(drop=True).to_feather(path)
         case ".pkl" | ".pickle":
-            df.to_pickle(path, index=False)
+            df.reset_index(drop=True).to_pickle(path)
         case ".tex":
             df.to_latex(path, index=False)
         case ".dta":
@@ -365,12 +1348,27 @@ def save_as(df: pd.DataFrame, path: Path):
             )
 
 
-def cache_path(query: SdmxQuery) -> Path:
-    """Get the file path where an SDMX query should be cached."""
-    CACHE_DIR: Path = Path(__file__).parent.parent.parent / "cache"
-    # Asterisk is an invalid character for file paths on Windows.
-    key = query.key.replace("*", "(ALL)")
-    return CACHE_DIR / query.source / query.dataflow / f"{key}.tsv"
+def _in_query_order(batches, results):
+    """Reorder the results of each batch into the results of each query."""
+    owners = {}
+    for batch_index, batch in enumerate(batches):
+        for i, query_index in enumerate(batch.indices):
+            owners[query_index] = (batch_index, i)
+
+    results = enumerate(results)
+    received = {}
+    remaining = {i: len(batch.indices) for i, batch in enumerate(batches)}
+    for query_index in range(len(owners)):
+        batch_index, i = owners[query_index]
+        # Batches are ordered by their first query, so they arrive just in time.
+        while batch_index not in received:
+            received.update([next(results)])
+        yield received[batch_index][i]
+        # Don't keep the result alive until the rest of its batch is yielded.
+        received[batch_index][i] = None
+        remaining[batch_index] -= 1
+        if remaining[batch_index] == 0:
+            del received[batch_index]
 
 
 def duplicates(items):
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+
+VALUE_DTYPES = {"float64", "float32"}
+# Formats of SDMX time periods that pandas can parse, by pandas frequency.
+PERIOD_FORMATS = {
+    "Y": r"\d{4}",
+    "Q": r"\d{4}-Q[1-4]",
+    "M": r"\d{4}-\d{2}",
+    "D": r"\d{4}-\d{2}-\d{2}",
+}
+
+
+def compact(df: pd.DataFrame, value_dtype: str = "float64") -> pd.DataFrame:
+    """Convert `value` to `value_dtype` and every other column of a table to a `Categorical`."""
+    columns = {}
+    for column in df.columns:
+        if column == "value":
+            columns[column] = df[column].astype(value_dtype)
+        elif not isinstance(df[column].dtype, pd.CategoricalDtype):
+            columns[column] = df[column].astype("category")
+    return df.assign(**columns)
+
+
+def concat(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate tables like `pd.concat`, but keep categorical columns categorical.
+
+    `pd.concat` only keeps a categorical column if every table has exactly the same
+    categories, so each one is given the union of the categories first.
+    """
+    dtypes = unify_categories(frames)
+    return pd.concat([with_categories(df, dtypes) for df in frames], ignore_index=True)
+
+
+def unify_categories(
+    frames: list[pd.DataFrame], dtypes: dict[str, pd.CategoricalDtype] | None = None
+) -> dict[str, pd.CategoricalDtype]:
+    """Get the union of the categories of each categorical column in some tables.
+
+    The categories in `dtypes` (e.g. from earlier tables) are included as well.
+    """
+    categories = {column: dtype.categories for column, dtype in (dtypes or {}).items()}
+    for df in frames:
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                new = df[column].cat.categories
+                old = categories.get(column)
+                categories[column] = new if old is None else old.union(new)
+    return {
+        column: pd.CategoricalDtype(categories)
+        for column, categories in categories.items()
+    }
+
+
+def with_categories(
+    df: pd.DataFrame, dtypes: dict[str, pd.CategoricalDtype]
+) -> pd.DataFrame:
+    """Give the categorical columns of a table the categories from `unify_categories`.
+
+    Columns that are missing or entirely null are converted too.
+    """
+    columns = {}
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            columns[column] = pd.Categorical.from_codes(
+                np.full(len(df), -1), dtype=dtype
+            )
+        elif df[column].dtype != dtype:
+            columns[column] = df[column].astype(dtype)
+    return df.assign(**columns)
+
+
+def to_periods(series: pd.Series) -> pd.Series | None:
+    """Parse SDMX time periods to pandas periods, if they all have the same frequency."""
+    categorical = series.astype("category")
+    categories = categorical.cat.categories.astype(str)
+    for freq, pattern in PERIOD_FORMATS.items():
+        if categories.str.fullmatch(pattern).all():
+            periods = pd.PeriodIndex(categories, freq=freq)
+            # Parse each distinct period once.
+            codes = categorical.cat.codes.to_numpy()
+            return pd.Series(
+                periods.take(codes, allow_fill=True),
+                index=series.index,
+                name=series.name,
+            )
+    return None
@@ -1,9 +1,12 @@
-import requests_cache
-import sdmx
-
-from datetime import timedelta
+import argparse
 
 from .repl import SdmxRepl
+from .session import (
+    add_session_arguments,
+    client_from_arguments,
+    store_from_arguments,
+)
+from .transport import add_transport_arguments, transport_from_arguments
 
 
 def main():
@@ -15,12 +18,22 @@ def main():
 
 
 def _main():
-    SdmxRepl(
-        client=sdmx.Client(
-            backend=requests_cache.SQLiteCache(
-                db_path=__package__,
-                use_cache_dir=True,
-            ),
-            expire_after=timedelta(days=1),
-        )
-    ).run()
+    parser = argparse.ArgumentParser(
+        add_help=False,
+        usage="explore [--no-http-cache] [--http-cache-ttl <RESOURCE_TYPE=SECONDS>] [--connect-timeout <SECONDS>] [--read-timeout <SECONDS>] [--record <DIR> | --replay <PATH>]",
+    )
+    add_session_arguments(parser)
+    add_transport_arguments(parser)
+    parser.add_argument(
+        "-h",
+        "--help",
+        action="help",
+        default=argparse.SUPPRESS,
+        help="Show this message.",
+    )
+    args = parser.parse_args()
+    adapter = transport_from_arguments(parser, args)
+
+    client = client_from_arguments(args, adapter)
+    store = store_from_arguments(args, adapter)
+    SdmxRepl(client=client, store=store).run()
@@ -0,0 +1,139 @@
+import requests
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import threading
+import time
+
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+THROTTLE_STATUS_CODES = {429, 503}
+# Status codes that servers respond with when a response is too large (or too slow) to produce.
+# Other server errors (e.g. HTTP 500) are usually unrelated to the size of the response.
+OVERSIZED_STATUS_CODES = {413, 504}
+
+
+class TokenBucket:
+    """A thread-safe token bucket that allows `rate` requests per second on average.
+
+    If `rate` is `None`, requests are only delayed while the bucket is paused.
+    """
+
+    def __init__(self, rate: float | None = None, burst: float = 1):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._paused_until)
+            if self.rate is not None:
+                self._refill(now)
+                # Tokens can go negative to reserve a slot for each waiting request.
+                self._tokens -= 1
+                if self._tokens < 0:
+                    start = max(start, now - self._tokens / self.rate)
+            wait = start - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Allow no requests for the next `seconds` seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def throttle(self):
+        """Halve the rate after being throttled by the server."""
+        with self._lock:
+            if self.rate is not None:
+                self._refill(time.monotonic())
+                self.rate = max(self.rate / 2, self.max_rate / 16)
+
+    def recover(self):
+        """Step the rate back towards its maximum after a successful request."""
+        with self._lock:
+            if self.rate is not None:
+                self._refill(time.monotonic())
+                self.rate = min(self.rate + self.max_rate / 8, self.max_rate)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    """A collection of token buckets keyed by SDMX source ID."""
+
+    def __init__(self, rates: dict[str, float] | None = None):
+        self.rates = rates or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, source_id: str) -> TokenBucket:
+        with self._lock:
+            if source_id not in self._buckets:
+                self._buckets[source_id] = TokenBucket(self.rates.get(source_id))
+            return self._buckets[source_id]
+
+    def acquire(self, source_id: str):
+        self.bucket(source_id).acquire()
+
+    def success(self, source_id: str):
+        self.bucket(source_id).recover()
+
+    def failure(self, source_id: str, err: BaseException) -> float | None:
+        """Record a failed request and return the server's requested delay (if any)."""
+        bucket = self.bucket(source_id)
+        if status_code(err) in THROTTLE_STATUS_CODES:
+            bucket.throttle()
+        delay = retry_after(err)
+        if delay is not None:
+            bucket.pause(delay)
+        return delay
+
+
+def status_code(err: BaseException) -> int | None:
+    response = getattr(err, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def is_retryable(err: BaseException) -> bool:
+    """Check whether a failed request might succeed if retried."""
+    if isinstance(err, requests.HTTPError):
+        return status_code(err) in RETRYABLE_STATUS_CODES
+    # Parse errors, missing resources, etc. will fail the same way every time.
+    return isinstance(err, requests.RequestException)
+
+
+def is_oversized(err: BaseException) -> bool:
+    """Check whether a failed request might succeed if it asked for less data."""
+    if isinstance(err, requests.HTTPError):
+        return status_code(err) in OVERSIZED_STATUS_CODES
+    return isinstance(
+        err, (requests.ReadTimeout, requests.exceptions.ChunkedEncodingError)
+    )
+
+
+def retry_after(err: BaseException) -> float | None:
+    """Parse the `Retry-After` header of a failed request, in seconds."""
+    response = getattr(err, "response", None)
+    value = getattr(response, "headers", {}).get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0)
@@ -0,0 +1,86 @@
+from dataclasses import asdict, dataclass
+import json
+import os
+from pathlib import Path
+import threading
+
+from .cache import file_hash
+from .path import SdmxQuery
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    """A completed query and the location of its intermediate result."""
+
+    rows: int
+    sha256: str | None = None
+    path: str | None = None
+    dimensions: list[str] | None = None
+
+
+class Manifest:
+    """A record of the completed queries in a download, for resuming after a failure."""
+
+    def __init__(self, path: Path, entries: dict[str, ManifestEntry] | None = None):
+        self.path = path
+        self.entries = entries or {}
+        # Only queries completed by a previous run can be resumed.
+        self._previous = dict(self.entries)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(output_path: Path) -> Path:
+        """Get the file path of the manifest for a given output path."""
+        return output_path.with_name(f"{output_path.name}.manifest.json")
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        entries = {
+            query: ManifestEntry(**entry) for query, entry in data["queries"].items()
+        }
+        return cls(path, entries)
+
+    def completed(self, query: SdmxQuery) -> ManifestEntry | None:
+        """Get the entry for a completed query, if its intermediate result is intact."""
+        entry = self._previous.get(str(query))
+        if entry is None or entry.path is None:
+            return entry
+        try:
+            if file_hash(Path(entry.path)) == entry.sha256:
+                return entry
+        except FileNotFoundError:
+            pass
+        return None
+
+    def record(
+        self,
+        query: SdmxQuery,
+        rows: int,
+        path: Path | None = None,
+        dimensions: list[str] | None = None,
+    ):
+        entry = ManifestEntry(
+            rows=rows,
+            sha256=None if path is None else file_hash(path),
+            path=None if path is None else str(path),
+            dimensions=dimensions,
+        )
+        with self._lock:
+            self.entries[str(query)] = entry
+            self.save()
+
+    def save(self):
+        data = {
+            "queries": {query: asdict(entry) for query, entry in self.entries.items()}
+        }
+        # Write atomically so that an interrupted save can't corrupt the manifest.
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,287 @@
+from lxml import etree
+import pandas as pd
+import sdmx
+
+import io
+from typing import IO, Iterator
+
+
+CHUNK_SIZE = 100_000
+# Media types of SDMX-CSV for each version of the SDMX REST API.
+SDMX_CSV_TYPES = {
+    "2.1": "application/vnd.sdmx.data+csv;version=1.0.0",
+    "3.0.0": "application/vnd.sdmx.data+csv;version=2.0.0",
+}
+# SDMX-CSV columns that identify the dataflow rather than an observation.
+SDMX_CSV_STRUCTURE_COLUMNS = [
+    "DATAFLOW",
+    "STRUCTURE",
+    "STRUCTURE_ID",
+    "STRUCTURE_NAME",
+    "ACTION",
+]
+
+
+def to_frame(msg) -> pd.DataFrame | None:
+    """Convert an SDMX data message to a table with a row per observation."""
+    if msg.data[0].series:
+        return sdmx.to_pandas(msg).reset_index()
+
+
+def parse_data(
+    content: bytes,
+    stream: bool = False,
+    dimensions: list[str] | None = None,
+    measure: str = "OBS_VALUE",
+    csv: bool = False,
+) -> pd.DataFrame | None:
+    """Parse the raw content of an SDMX data message and convert it to a table.
+
+    If `csv` is true, the content is SDMX-CSV and is parsed with `read_csv_data`.
+    If `stream` is true, the content is parsed with `read_data` instead of being
+    loaded as a full `sdmx` message. This can run in a worker process, so it only
+    takes and returns picklable values.
+    """
+    if csv:
+        return read_csv_data(
+            io.BytesIO(content), dimensions=dimensions, measure=measure
+        )
+    if stream:
+        return read_data(io.BytesIO(content), measure=measure)
+    return to_frame(sdmx.read_sdmx(io.BytesIO(content)))
+
+
+def read_data(
+    source: IO[bytes],
+    measure: str = "OBS_VALUE",
+    chunk_size: int = CHUNK_SIZE,
+) -> pd.DataFrame | None:
+    """Read an SDMX-ML data message into a single table with `iter_data`."""
+    chunks = list(iter_data(source, measure, chunk_size))
+    if not chunks:
+        return None
+    # The last table has every dimension, in order. Dimensions that first appeared in a
+    # later table are empty in the earlier ones.
+    columns = list(chunks[-1].columns)
+    df = pd.concat(chunks, ignore_index=True)[columns]
+    return df.fillna({x: "" for x in columns if x != "value"})
+
+
+def read_csv_data(
+    source: IO[bytes],
+    dimensions: list[str] | None = None,
+    measure: str = "OBS_VALUE",
+) -> pd.DataFrame | None:
+    """Read an SDMX-CSV data message into a table with the same columns as `to_frame`.
+
+    The columns are `TIME_PERIOD`, the other `dimensions` in order, then `value`.
+    Other columns (i.e. attributes) are left out. If `dimensions` isn't given, every
+    column of the message is taken to be a dimension.
+    """
+    # Read every column as a string, the same as an SDMX-ML message.
+    df = pd.read_csv(source, dtype=str, keep_default_na=False)
+    if df.empty:
+        return None
+    df = df.drop(columns=SDMX_CSV_STRUCTURE_COLUMNS, errors="ignore")
+    df = df.rename(columns={measure: "value"})
+    if dimensions is None:
+        dimensions = [x for x in df.columns if x != "value"]
+    # The dimension at the observation level comes first, like in `iter_data`.
+    columns = ["TIME_PERIOD"] if "TIME_PERIOD" in df.columns else []
+    columns.extend(x for x in dimensions if x in df.columns and x not in columns)
+    return df[[*columns, "value"]].assign(
+        value=lambda df: pd.to_numeric(df["value"], errors="coerce").astype(float)
+    )
+
+
+def iter_data(
+    source: IO[bytes],
+    measure: str = "OBS_VALUE",
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[pd.DataFrame]:
+    """Parse an SDMX-ML data message incrementally, yielding tables of observations.
+
+    Both generic and structure-specific messages are supported. Each table has up to
+    `chunk_size` rows, with the same columns as `to_frame`: the dimensions (starting
+    with the dimension at the observation level), then `value`. Elements are
+    discarded as soon as they are parsed, so memory use doesn't grow with the size of
+    the message.
+
+    Structure-specific messages don't mark which fields of a series or group are
+    dimensions, so like `sdmx`, they are taken to be dimensions unless they were
+    already seen as attributes (e.g. of an observation). A dimension that first
+    appears after a table was yielded is only in the tables after it. `measure` is
+    the ID of the primary measure in structure-specific messages.
+    """
+    obs_dimension = "TIME_PERIOD"
+    # Dimensions in the order that `sdmx` adds them to the data structure it infers.
+    dimensions = []
+    attributes = set()
+    # Fields of structure-specific groups that haven't been seen in a key yet, which
+    # `sdmx` takes to be attributes after all.
+    group_fields = set()
+    # The key of the current series, and its observations so far (the key of a
+    # structure-specific series is only known once its observations are parsed).
+    series = None
+    rows = []
+    # The key and value of the current observation.
+    obs = None
+    value = None
+    # The generic `Value`s of the current key or attributes.
+    section = None
+    values = {}
+    in_group = False
+    error = None
+    chunk = _Chunk()
+
+    def key(fields):
+        for x in fields:
+            if x not in attributes and x not in dimensions:
+                dimensions.append(x)
+            group_fields.discard(x)
+        return {x: v for x, v in fields.items() if x not in attributes}
+
+    def columns():
+        return [x for x in dimensions if x not in group_fields]
+
+    for event, elem in etree.iterparse(source, events=("start", "end")):
+        tag = elem.tag.rpartition("}")[2]
+        if event == "start":
+            match tag:
+                case "Structure" if "dimensionAtObservation" in elem.attrib:
+                    obs_dimension = elem.get("dimensionAtObservation")
+                    if obs_dimension != "AllDimensions":
+                        key({obs_dimension: None})
+                case "Group":
+                    in_group = True
+                case "Series" if not in_group:
+                    series = {}
+                case "Obs" if not in_group:
+                    obs = {}
+                    value = None
+                case "SeriesKey" | "ObsKey" | "Attributes" | "GroupKey":
+                    section = tag
+                    values = {}
+                case "Error":
+                    error = []
+            continue
+
+        match tag:
+            case "Value" if section is not None:
+                values[elem.get("id")] = elem.get("value")
+            case "SeriesKey" if series is not None:
+                series = key(values)
+                section = None
+            case "ObsKey" if obs is not None:
+                obs.update(key(values))
+                section = None
+            case "GroupKey":
+                key(values)
+                section = None
+            case "Attributes":
+                attributes.update(values)
+                section = None
+            case "ObsDimension" if obs is not None:
+                obs.update(key({obs_dimension: elem.get("value")}))
+            case "ObsValue" if obs is not None:
+                value = elem.get("value")
+            case "Obs" if obs is not None:
+                if elem.attrib:
+                    # A structure-specific observation.
+                    fields = _fields(elem, measure)
+                    value = fields.pop("value", None)
+                    if obs_dimension == "AllDimensions":
+                        obs.update(key(fields))
+                    else:
+                        obs.update(
+                            key({obs_dimension: fields.pop(obs_dimension, None)})
+                        )
+                        attributes.update(fields)
+                # Like `to_frame`, observations that aren't in a series are left out.
+                if series is not None:
+                    rows.append((obs, value))
+                obs = None
+                _discard(elem)
+            case "Series" if series is not None:
+                if elem.attrib:
+                    # A structure-specific series.
+                    series = key(_fields(elem, measure))
+                for obs_key, obs_value in rows:
+                    chunk.append({**series, **obs_key}, obs_value)
+                    if len(chunk) >= chunk_size:
+                        yield chunk.to_frame(columns())
+                        chunk = _Chunk()
+                series = None
+                rows = []
+                _discard(elem)
+            case "Group":
+                if elem.attrib:
+                    # A structure-specific group.
+                    for x in _fields(elem, measure):
+                        if x not in attributes and x not in dimensions:
+                            dimensions.append(x)
+                            group_fields.add(x)
+                in_group = False
+                _discard(elem)
+            case "Text" if error is not None:
+                error.append(elem.text or "")
+            case "ErrorMessage" if error is not None:
+                error.insert(0, f"[{elem.get('code')}]")
+            case "Error":
+                raise ValueError(f"SDMX error message: {' '.join(error)}")
+
+    if len(chunk):
+        yield chunk.to_frame(columns())
+
+
+class _Chunk:
+    """Columns of observations, built up one row at a time."""
+
+    def __init__(self):
+        self.columns = {}
+        self.values = []
+        # Codes repeat across rows, so share one string object for each of them.
+        self.strings = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, key, value):
+        for x in key.keys() - self.columns.keys():
+            self.columns[x] = [""] * len(self.values)
+        for x, column in self.columns.items():
+            code = key.get(x) or ""
+            column.append(self.strings.setdefault(code, code))
+        self.values.append(value)
+
+    def to_frame(self, dimensions):
+        # Missing dimensions are empty, the same as in `to_frame`.
+        empty = [""] * len(self.values)
+        df = pd.DataFrame(
+            {x: self.columns.get(x, empty) for x in dimensions},
+            index=pd.RangeIndex(len(self.values)),
+        )
+        df["value"] = pd.to_numeric(pd.Series(self.values), errors="coerce").astype(
+            float
+        )
+        return df
+
+
+def _fields(elem, measure):
+    """Get the fields of a structure-specific series or observation."""
+    fields = {}
+    for key, value in elem.attrib.items():
+        # Skip namespaced attributes like `xsi:type`.
+        if key.startswith("{"):
+            continue
+        fields["value" if key == measure else key] = value
+    return fields
+
+
+def _discard(elem):
+    """Free a parsed element and the siblings before it."""
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
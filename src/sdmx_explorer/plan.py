@@ -0,0 +1,209 @@
+from collections import defaultdict
+from concurrent.futures import wait
+from dataclasses import dataclass
+import math
+
+from .path import SdmxQuery
+
+
+# The number of smaller queries that an oversized query is split into at a time.
+SPLIT_PARTS = 4
+
+
+@dataclass(frozen=True)
+class QueryBatch:
+    """A group of queries that can be requested together as a single query.
+
+    The queries are against the same dataflow and their keys only differ at
+    `position`, so they can be merged by joining their codes at that position with
+    `+`.
+    """
+
+    indices: tuple[int, ...]
+    queries: tuple[SdmxQuery, ...]
+    position: int | None = None
+
+    def merge(self, queries=None) -> SdmxQuery:
+        """Merge some (or all) of the queries in this batch into a single query."""
+        if queries is None:
+            queries = self.queries
+        if len(queries) == 1 or self.position is None:
+            return queries[0]
+
+        parts = queries[0].key.split(".")
+        codes = dict.fromkeys(
+            code
+            for query in queries
+            for code in query.key.split(".")[self.position].split("+")
+        )
+        parts[self.position] = "+".join(codes)
+        return SdmxQuery(
+            source=queries[0].source,
+            dataflow=queries[0].dataflow,
+            key=".".join(parts),
+        )
+
+    def codes(self, query: SdmxQuery) -> list[str]:
+        """Get the codes that a query selects at the merged position."""
+        return query.key.split(".")[self.position].split("+")
+
+
+def split_query(
+    query: SdmxQuery,
+    position: int,
+    codes: list[str],
+    parts: int = SPLIT_PARTS,
+    max_key_length: int = 1000,
+) -> list[SdmxQuery]:
+    """Split a query into smaller queries that each select some of `codes` at `position`.
+
+    The query is split into more parts if needed to keep each key within
+    `max_key_length`.
+    """
+    key_parts = query.key.split(".")
+    parts = min(parts, len(codes))
+    while True:
+        size = math.ceil(len(codes) / parts)
+        keys = []
+        for i in range(0, len(codes), size):
+            key_parts[position] = "+".join(codes[i : i + size])
+            keys.append(".".join(key_parts))
+        if size == 1 or all(len(key) <= max_key_length for key in keys):
+            break
+        parts *= 2
+    return [
+        SdmxQuery(source=query.source, dataflow=query.dataflow, key=key) for key in keys
+    ]
+
+
+def plan_batches(
+    queries: list[SdmxQuery],
+    coalesce: bool = False,
+    max_key_length: int = 1000,
+) -> list[QueryBatch]:
+    """Group queries into batches, ordered by the first query in each batch."""
+    batches = []
+    assigned = set()
+    if coalesce:
+        # Bucket queries by their key with one position masked out.
+        buckets = defaultdict(list)
+        for i, query in enumerate(queries):
+            parts = query.key.split(".")
+            for position, part in enumerate(parts):
+                # Wildcards already match every code, so there is nothing to merge.
+                if part == "*":
+                    continue
+                masked = tuple(parts[:position] + parts[position + 1 :])
+                buckets[
+                    (query.source, query.dataflow, len(parts), position, masked)
+                ].append(i)
+
+        # Greedily merge the largest buckets first.
+        for (*_, position, _), indices in sorted(
+            buckets.items(), key=lambda item: -len(item[1])
+        ):
+            indices = [i for i in indices if i not in assigned]
+            if len(indices) < 2:
+                continue
+            batch = []
+            for i in indices:
+                candidate = QueryBatch(
+                    indices=tuple(batch + [i]),
+                    queries=tuple(queries[j] for j in batch + [i]),
+                    position=position,
+                )
+                if batch and len(candidate.merge().key) > max_key_length:
+                    batches.append(_batch(queries, batch, position))
+                    batch = []
+                batch.append(i)
+            batches.append(_batch(queries, batch, position))
+            assigned.update(indices)
+
+    for i, query in enumerate(queries):
+        if i not in assigned:
+            batches.append(_batch(queries, [i], None))
+
+    batches.sort(key=lambda batch: batch.indices[0])
+    return batches
+
+
+def _batch(queries, indices, position):
+    if len(indices) == 1:
+        position = None
+    return QueryBatch(
+        indices=tuple(indices),
+        queries=tuple(queries[i] for i in indices),
+        position=position,
+    )
+
+
+def warm_up(executor, context, queries, source_limits):
+    """Fetch the structures needed by `queries` in parallel, before any data.
+
+    `context` returns an `SdmxContext` for the current worker thread. Structure
+    messages are cached by `sdmx.Client` for every context, so afterwards each query
+    can resolve its source, dataflow, and key without waiting on any requests.
+    """
+
+    def run(source, f, *args):
+        with source_limits[source]:
+            ctx = context()
+            try:
+                ctx.select_source(source)
+                return f(ctx, *args)
+            except Exception:
+                # Errors are reported when each query runs.
+                return None
+
+    def get_dataflows(ctx):
+        ctx.get_dataflow()
+
+    def get_datastructure(ctx, dataflow):
+        ctx.select_dataflow(dataflow)
+        ctx.get_datastructure()
+        # The codelist of each key dimension in order, or `None` if it has none, so that
+        # each part of a key lines up with its dimension.
+        codelists = []
+        for dimension in ctx.key_dimensions():
+            try:
+                codelist = ctx.codelist(dimension)
+            except ValueError:
+                codelists.append(None)
+                continue
+            codelists.append((dimension.id, codelist.maintainer.id, codelist.id))
+        return codelists
+
+    def get_codelist(ctx, dataflow, dimension):
+        ctx.select_dataflow(dataflow)
+        ctx.get_codelist(dimension)
+
+    # Dataflows of each source.
+    sources = dict.fromkeys(query.source for query in queries)
+    wait([executor.submit(run, source, get_dataflows) for source in sources])
+
+    # Datastructures of each dataflow.
+    dataflows = dict.fromkeys((query.source, query.dataflow) for query in queries)
+    futures = {
+        (source, dataflow): executor.submit(run, source, get_datastructure, dataflow)
+        for source, dataflow in dataflows
+    }
+    codelists = {key: future.result() for key, future in futures.items()}
+
+    # Codelists of each dimension that is constrained by a key, without duplicates.
+    tasks = {}
+    for query in queries:
+        dimensions = codelists.get((query.source, query.dataflow)) or []
+        for codelist, part in zip(dimensions, query.key.split(".")):
+            if codelist is None or part == "*":
+                continue
+            dimension_id, agency_id, codelist_id = codelist
+            tasks.setdefault(
+                (query.source, agency_id, codelist_id),
+                (query.source, query.dataflow, dimension_id),
+            )
+    wait(
+        [
+            executor.submit(run, source, get_codelist, dataflow, dimension_id)
+            for source, dataflow, dimension_id in tasks.values()
+        ]
+    )
@@ -15,7 +15,7 @@ log = logging.getLogger(__name__)
 
 
 class SdmxRepl:
-    def __init__(self, client=None):
+    def __init__(self, client=None, store=None):
         # Display:
         self.console = CONSOLE
         self.max_unpaged_rows = 12
@@ -23,7 +23,7 @@ class SdmxRepl:
         self.verbose = False
 
         # SDMX:
-        self.ctx = SdmxContext(client, self.console)
+        self.ctx = SdmxContext(client, self.console, store=store)
         self.dimension = None
 
     def run(self):
@@ -46,7 +46,7 @@ class SdmxRepl:
 
     def prompt(self):
         if self.dimension is not None:
-            dimension_idx = self.ctx.key_dimensions().index(self.dimension)
+            dimension_idx = self.ctx.key_dimension_position(self.dimension)
             dimensions = {dimension_idx: self.dimension.id}
         else:
             dimensions = None
@@ -81,6 +81,8 @@ class SdmxRepl:
                 self.do_list()
             case "info" | "i":
                 self.do_info()
+            case "stats":
+                self.do_stats()
             # TODO: Add this command when SDMX 3.0 is better-supported.
             # case "preview" | "p":
             #     self.do_preview()
@@ -147,6 +149,10 @@ class SdmxRepl:
             "info, i",
             "Show information on the current path",
         )
+        table.add_row(
+            "stats",
+            "Show where time went in each request so far",
+        )
         table.add_row(
             "<INDEX>, <ID>",
             f"Select a {child} by its index or its ID",
@@ -250,8 +256,7 @@ class SdmxRepl:
 
         if self.ctx.dataflow is not None:
             dataflow = self.ctx.dataflow
-            dataflows = self.ctx.dataflows()
-            dataflow_idx = dataflows.index(dataflow)
+            dataflow_idx = self.ctx.dataflow_position(dataflow)
             table.add_row(
                 "Dataflow",
                 str(dataflow_idx),
@@ -260,16 +265,14 @@ class SdmxRepl:
                 escape(self._localize(dataflow.description)),
             )
 
-            dimensions = self.ctx.key_dimensions()
             for dimension_id, dimension_codes in self.ctx.key_codes.items():
                 if not dimension_codes and (
                     self.dimension is None or dimension_id != self.dimension.id
                 ):
                     continue
 
-                (dimension_idx, dimension) = next(
-                    x for x in enumerate(dimensions) if x[1].id == dimension_id
-                )
+                dimension = self.ctx.to_key_dimension(dimension_id)
+                dimension_idx = self.ctx.key_dimension_position(dimension)
                 concept = dimension.concept_identity
                 table.add_row(
                     "Dimension",
@@ -282,9 +285,8 @@ class SdmxRepl:
                 if not dimension_codes:
                     continue
 
-                codes = self.ctx.codes(dimension)
                 for code in sorted(dimension_codes):
-                    code_idx = codes.index(code)
+                    code_idx = self.ctx.code_position(dimension, code)
                     table.add_row(
                         "Code",
                         str(code_idx),
@@ -296,6 +298,9 @@ class SdmxRepl:
         # Display table.
         self._print_table(table)
 
+    def do_stats(self):
+        self._print_table(self.ctx.stats.table(), empty="Nothing requested yet")
+
     def do_list(self):
         if self.ctx.client.source is NoSource:
             self._list_sources()
@@ -0,0 +1,195 @@
+import requests_cache
+from requests.adapters import BaseAdapter, HTTPAdapter
+import sdmx
+
+import argparse
+
+from .cache import CACHE_DIR
+from .store import StructureStore
+from .transport import mount_transport
+
+
+HTTP_CACHE_PATH = CACHE_DIR / "http.sqlite"
+
+# The number of seconds that responses stay fresh for, by resource type. Expired
+# responses are kept, and revalidated with `ETag` or `Last-Modified` when they're
+# requested again, so that unchanged structures don't have to be received again.
+# Data is always revalidated, since `cache_ttl` decides how long query results stay fresh.
+HTTP_CACHE_TTLS: dict[str, float] = {
+    "data": 0,
+    "dataflow": 24 * 60 * 60,
+    "datastructure": 7 * 24 * 60 * 60,
+    "codelist": 7 * 24 * 60 * 60,
+}
+HTTP_CACHE_DEFAULT_TTL = 24 * 60 * 60
+
+# The number of connections kept open to each host (at least as many as the requests
+# sent to it at a time, or the others are closed after each response).
+POOL_SIZE = 16
+# The number of hosts that connections are kept open to.
+POOL_HOSTS = 16
+# The number of seconds to wait for a connection, and then for each part of the response.
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT = 300
+ACCEPT_ENCODING = "gzip, deflate"
+
+
+class PooledAdapter(HTTPAdapter):
+    """Keep connections to each host open between requests, with default timeouts."""
+
+    def __init__(self, timeout: tuple[float, float], **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+def pool_connections(
+    client: sdmx.Client,
+    pool_size: int = POOL_SIZE,
+    connect_timeout: float = CONNECT_TIMEOUT,
+    read_timeout: float = READ_TIMEOUT,
+) -> sdmx.Client:
+    """Send every request of a client through a pool of compressed, keep-alive connections.
+
+    The pool is shared by every client made by `client_like`, so that concurrent
+    requests to a source reuse connections instead of opening new ones.
+    """
+    adapter = PooledAdapter(
+        timeout=(connect_timeout, read_timeout),
+        pool_connections=POOL_HOSTS,
+        pool_maxsize=pool_size,
+    )
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+    client.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return client
+
+
+def cached_client(
+    ttls: dict[str, float] | None = None,
+    pool_size: int = POOL_SIZE,
+    connect_timeout: float = CONNECT_TIMEOUT,
+    read_timeout: float = READ_TIMEOUT,
+) -> sdmx.Client:
+    """Make a client that caches responses in `HTTP_CACHE_PATH`, shared by every process.
+
+    `ttls` overrides `HTTP_CACHE_TTLS` for some resource types. The other arguments
+    are passed to `pool_connections`.
+    """
+    ttls = {**HTTP_CACHE_TTLS, **(ttls or {})}
+    HTTP_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    client = sdmx.Client(
+        backend=requests_cache.SQLiteCache(db_path=HTTP_CACHE_PATH, wal=True),
+        expire_after=HTTP_CACHE_DEFAULT_TTL,
+        # SDMX 3.0 data URLs also contain "/dataflow/", so "data" must be matched first.
+        urls_expire_after={
+            f"*/{resource_type}/*": ttl
+            for resource_type, ttl in sorted(ttls.items(), key=lambda x: x[0] != "data")
+        },
+        # Better than failing when a source is down.
+        stale_if_error=True,
+    )
+    return pool_connections(
+        client,
+        pool_size=pool_size,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+    )
+
+
+def add_session_arguments(parser: argparse.ArgumentParser):
+    """Add the command-line arguments that configure the HTTP cache and connections."""
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        default=False,
+        help="Don't cache responses on disk.",
+    )
+    parser.add_argument(
+        "--http-cache-ttl",
+        type=_ttl,
+        action="append",
+        default=[],
+        metavar="RESOURCE_TYPE=SECONDS",
+        help="Keep cached responses for a resource type (e.g. codelist) fresh for this many seconds.",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=None,
+        metavar="CONNECTIONS",
+        help=f"Keep up to this many connections open to each host (default: {POOL_SIZE}).",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=CONNECT_TIMEOUT,
+        metavar="SECONDS",
+        help="Wait this many seconds for a connection before failing.",
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=READ_TIMEOUT,
+        metavar="SECONDS",
+        help="Wait this many seconds for each part of a response before failing.",
+    )
+
+
+def client_from_arguments(
+    args: argparse.Namespace, adapter: BaseAdapter | None, pool_size: int = POOL_SIZE
+) -> sdmx.Client:
+    """Make the client selected by `add_session_arguments` and the transport adapter.
+
+    `pool_size` is used unless `--pool-size` was passed.
+    """
+    if args.pool_size is not None:
+        pool_size = args.pool_size
+    pool = {
+        "pool_size": pool_size,
+        "connect_timeout": args.connect_timeout,
+        "read_timeout": args.read_timeout,
+    }
+    if adapter is not None or args.no_http_cache:
+        client = pool_connections(sdmx.Client(), **pool)
+    else:
+        client = cached_client(dict(args.http_cache_ttl), **pool)
+    # Cached responses would never be recorded, and replayed ones shouldn't be cached.
+    return mount_transport(client, adapter)
+
+
+def store_from_arguments(
+    args: argparse.Namespace, adapter: BaseAdapter | None
+) -> StructureStore | None:
+    """Make the structure store selected by `add_session_arguments` (if any).
+
+    Structures are stored as long as their responses would stay fresh in the HTTP
+    cache, and not at all with `--no-http-cache`.
+    """
+    # Stored structures would never be recorded or replayed.
+    if adapter is not None or args.no_http_cache:
+        return None
+    return StructureStore(ttls=dict(args.http_cache_ttl))
+
+
+def _ttl(value: str) -> tuple[str, float]:
+    resource_type, sep, seconds = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(
+            f"expected RESOURCE_TYPE=SECONDS, got {value!r}"
+        )
+    if resource_type not in sdmx.Resource.__members__:
+        raise argparse.ArgumentTypeError(
+            f"unsupported resource type: {resource_type!r}"
+        )
+    try:
+        ttl = float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number of seconds: {seconds!r}")
+    if ttl < 0:
+        raise argparse.ArgumentTypeError(f"number of seconds is negative: {seconds!r}")
+    return (resource_type, ttl)
@@ -0,0 +1,212 @@
+import pandas as pd
+
+import os
+from pathlib import Path
+import tempfile
+from urllib.parse import quote
+
+from .dtypes import unify_categories, with_categories
+
+
+STREAMING_TABLE_EXTENSIONS = {
+    ".tsv",
+    ".csv",
+    ".parquet",
+    ".feather",
+}
+# The partition value used for nulls, which Hive, Spark, DuckDB, and Arrow read as null.
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+PARTITION_FILE_NAME = "part-0.parquet"
+
+
+class Spool:
+    """A sequence of tables that are spilled to disk as they arrive, to be read back later.
+
+    Tables are read back in order, one at a time, with every column of the combined
+    table. This keeps memory bounded by the largest table rather than by all of them.
+    """
+
+    def __init__(self, dir: Path | None = None, prefix: str = ".spool."):
+        self.rows = 0
+        # Columns in order of first appearance, the same as `pd.concat`.
+        self.columns = {}
+        # Every table is given the same categories, so that they can share a schema.
+        self.dtypes = {}
+        self._parts = []
+        self._dir = tempfile.TemporaryDirectory(prefix=prefix, dir=dir)
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        columns = list(self.columns)
+        for part in self._parts:
+            df = pd.read_pickle(part).reindex(columns=columns)
+            yield with_categories(df, self.dtypes)
+
+    def append(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        part = Path(self._dir.name) / f"{len(self._parts)}.pkl"
+        df.to_pickle(part)
+        self._parts.append(part)
+        self.columns.update(dict.fromkeys(df.columns))
+        self.dtypes = unify_categories([df], self.dtypes)
+        self.rows += len(df)
+
+    def cleanup(self):
+        self._dir.cleanup()
+
+
+class TableWriter:
+    """Write a table to a file one chunk at a time.
+
+    Chunks are spilled to disk as they arrive. When the writer is closed, every column
+    is known, so the chunks are appended to the output file one at a time. This keeps
+    memory bounded by the largest chunk rather than by the whole table.
+    """
+
+    def __init__(self, path: Path):
+        if path.suffix not in STREAMING_TABLE_EXTENSIONS:
+            raise ValueError(
+                f"Unsupported file extension for streaming tabular data: {str(path)!r}"
+            )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._spool = Spool(dir=path.parent, prefix=f".{path.name}.")
+
+    @property
+    def rows(self) -> int:
+        return self._spool.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._spool.cleanup()
+
+    def append(self, df: pd.DataFrame):
+        self._spool.append(df)
+
+    def chunks(self):
+        """Yield each chunk in order, with every column of the combined table."""
+        return iter(self._spool)
+
+    def close(self):
+        try:
+            if self.rows:
+                match self.path.suffix:
+                    case ".tsv":
+                        self._write_csv(sep="\t")
+                    case ".csv":
+                        self._write_csv(sep=",")
+                    case ".parquet" | ".feather":
+                        self._write_arrow()
+        finally:
+            self._spool.cleanup()
+
+    def _write_csv(self, sep):
+        for i, df in enumerate(self.chunks()):
+            df.to_csv(
+                self.path,
+                sep=sep,
+                index=False,
+                header=i == 0,
+                mode="w" if i == 0 else "a",
+            )
+
+    def _write_arrow(self):
+        import pyarrow as pa
+        import pyarrow.parquet
+
+        # Each column takes the type of the first chunk where it isn't entirely null.
+        tables = (
+            pa.Table.from_pandas(df, preserve_index=False) for df in self.chunks()
+        )
+        types = {}
+        metadata = None
+        for table in tables:
+            metadata = metadata or table.schema.metadata
+            for field, column in zip(table.schema, table.columns):
+                if field.name not in types:
+                    types[field.name] = None
+                if types[field.name] is None and column.null_count < len(column):
+                    types[field.name] = field.type
+        schema = pa.schema(
+            [(name, type or pa.string()) for name, type in types.items()],
+            metadata=metadata,
+        )
+
+        if self.path.suffix == ".parquet":
+            writer = pyarrow.parquet.ParquetWriter(self.path, schema)
+        else:
+            # Feather V2 is the Arrow IPC file format, compressed like `df.to_feather`.
+            writer = pa.ipc.new_file(
+                self.path, schema, options=pa.ipc.IpcWriteOptions(compression="lz4")
+            )
+        with writer:
+            for df in self.chunks():
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                writer.write_table(table.cast(schema))
+
+
+def write_partitions(directory: Path, df: pd.DataFrame, partition_by: list[str]) -> int:
+    """Write a table to a Hive-partitioned Parquet directory, with one file per partition.
+
+    Files whose contents are unchanged are left alone (keeping their modification
+    times), and files for partitions that no longer exist are removed. Returns the
+    number of files that were written.
+    """
+    # Missing columns are partitioned as null, the same as `pd.concat`.
+    df = df.assign(**{column: None for column in partition_by if column not in df})
+    if partition_by:
+        parts = df.groupby(partition_by, dropna=False, observed=True, sort=True)
+    else:
+        parts = [((), df)]
+
+    paths = set()
+    written = 0
+    for values, part in parts:
+        path = directory
+        for column, value in zip(partition_by, values):
+            value = NULL_PARTITION if pd.isna(value) else quote(str(value), safe="")
+            path /= f"{column}={value}"
+        path /= PARTITION_FILE_NAME
+        paths.add(path)
+        part = part.drop(columns=partition_by)
+        # Categories from other partitions would change the file.
+        part = part.assign(
+            **{
+                column: part[column].cat.remove_unused_categories()
+                for column in part.columns
+                if isinstance(part[column].dtype, pd.CategoricalDtype)
+            }
+        )
+        written += _write_if_changed(part.reset_index(drop=True), path)
+
+    # Remove partitions that no longer exist.
+    for path in directory.rglob("*.parquet"):
+        if path not in paths:
+            path.unlink()
+    for path in sorted(directory.rglob("*"), reverse=True):
+        if path.is_dir() and not any(path.iterdir()):
+            path.rmdir()
+    return written
+
+
+def _write_if_changed(df: pd.DataFrame, path: Path) -> bool:
+    """Write a table to a Parquet file, unless the file already has the same contents."""
+    content = df.to_parquet(index=False)
+    try:
+        if path.read_bytes() == content:
+            return False
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+    return True
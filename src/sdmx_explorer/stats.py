@@ -0,0 +1,119 @@
+from rich.markup import escape
+from rich.table import Table
+
+from collections import Counter
+from contextlib import contextmanager
+import threading
+import time
+
+
+# Phases of a request or query, in the order they happen.
+PHASES = {
+    "build": "Build",
+    "cache": "Cache",
+    "network": "Network",
+    "parse": "Parse",
+    "to_pandas": "To pandas",
+    "process": "Process",
+    "save": "Save",
+}
+COUNTS = {
+    "queries": "Queries",
+    "hits": "Hits",
+    "misses": "Misses",
+    "retries": "Retries",
+    "bytes": "Bytes",
+    "rows": "Rows",
+}
+
+
+class Stats:
+    """Totals of the time spent in each phase of requests and queries, by source.
+
+    Also counts queries, cache hits (query results, structures, and responses loaded
+    from disk) and misses (requests that were sent), retries, bytes received, and
+    rows produced. Shared by every context of a download, so it can be updated from
+    any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = Counter()
+
+    def add(self, source_id: str | None, name: str, amount: float = 1):
+        """Add to a phase or count of a source (or `None` if it isn't specific to one)."""
+        with self._lock:
+            self._totals[(source_id, name)] += amount
+
+    @contextmanager
+    def time(self, source_id: str | None, phase: str):
+        """Add the time spent in a `with` block to a phase of a source."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(source_id, phase, time.perf_counter() - start)
+
+    def get(self, source_id: str | None, name: str) -> float:
+        with self._lock:
+            return self._totals[(source_id, name)]
+
+    def copy(self) -> "Stats":
+        stats = Stats()
+        with self._lock:
+            stats._totals = self._totals.copy()
+        return stats
+
+    def since(self, earlier: "Stats") -> "Stats":
+        """Get what was recorded since `earlier` was copied from these stats."""
+        stats = Stats()
+        with self._lock, earlier._lock:
+            stats._totals = self._totals - earlier._totals
+        return stats
+
+    def table(self) -> Table:
+        """Make a table of each count and phase, for each source and for every source."""
+        with self._lock:
+            totals = self._totals.copy()
+        source_ids = sorted({source_id for source_id, _ in totals if source_id})
+
+        table = Table(
+            show_edge=True,
+            show_lines=False,
+        )
+        table.add_column(overflow="fold", style="bold")
+        for source_id in source_ids:
+            table.add_column(
+                header=f"[source]{escape(source_id)}[/]",
+                justify="right",
+            )
+        table.add_column(header="Total", justify="right")
+
+        for names in [COUNTS, PHASES]:
+            rows = 0
+            for name, header in names.items():
+                values = [totals[(source_id, name)] for source_id in source_ids]
+                total = sum(values) + totals[(None, name)]
+                if not total:
+                    continue
+                table.add_row(
+                    header,
+                    *(_format(name, value) for value in values),
+                    _format(name, total),
+                )
+                rows += 1
+            if rows:
+                table.add_section()
+        return table
+
+
+def _format(name: str, value: float) -> str:
+    if name in PHASES:
+        return f"{value:.2f}s"
+    if name == "bytes":
+        for unit in ["B", "KB", "MB"]:
+            if value < 1000:
+                return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+            value /= 1000
+        return f"{value:.1f} GB"
+    return str(int(value))
@@ -0,0 +1,206 @@
+import sdmx
+from sdmx.message import StructureMessage
+from sdmx.model import common, v21
+
+import json
+from pathlib import Path
+import pickle
+import sqlite3
+import threading
+import time
+
+from .cache import CACHE_DIR
+
+
+# Structures are assumed to change about as often as `explore` expires its HTTP cache.
+STRUCTURE_TTL = 24 * 60 * 60
+STRUCTURE_STORE_PATH = CACHE_DIR / "structures.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    key TEXT PRIMARY KEY,
+    saved_at REAL NOT NULL,
+    message BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dataflows (
+    key TEXT NOT NULL,
+    id TEXT NOT NULL,
+    agency TEXT,
+    version TEXT,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    structure_id TEXT,
+    structure_agency TEXT,
+    structure_version TEXT,
+    PRIMARY KEY (key, id)
+);
+"""
+
+
+class StructureStore:
+    """A persistent store of parsed SDMX structures, shared by every process.
+
+    Structures are keyed by source, resource type, agency, ID, and version. Lists of
+    dataflows (which can be very long) are stored one row per dataflow, with only
+    the fields that are needed to explore them and select one; other structures are
+    stored as pickled messages.
+
+    Structures stay fresh for `ttl` seconds, or for as long as `ttls` gives for their
+    resource type (e.g. the same as `--http-cache-ttl`).
+    """
+
+    def __init__(
+        self,
+        path: Path = STRUCTURE_STORE_PATH,
+        ttl: float = STRUCTURE_TTL,
+        ttls: dict[str, float] | None = None,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def load(self, source_id: str, kwargs: dict) -> StructureMessage | None:
+        """Load the structure message for a request, if it was stored recently enough."""
+        key = self._key(source_id, kwargs)
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT saved_at, message FROM messages WHERE key = ?", (key,)
+            ).fetchone()
+            ttl = self.ttls.get(kwargs["resource_type"], self.ttl)
+            if row is None or time.time() - row[0] > ttl:
+                return None
+            if not _is_dataflow_list(kwargs):
+                try:
+                    return pickle.loads(row[1])
+                except Exception:
+                    # Stored by an incompatible version of a dependency.
+                    return None
+            rows = connection.execute(
+                "SELECT id, agency, version, name, description, structure_id, structure_agency, structure_version FROM dataflows WHERE key = ?",
+                (key,),
+            ).fetchall()
+        return _dataflow_message(rows)
+
+    def save(self, source_id: str, kwargs: dict, msg: StructureMessage):
+        """Store the structure message received for a request."""
+        key = self._key(source_id, kwargs)
+        if _is_dataflow_list(kwargs):
+            message = b""
+            rows = [(key, *_dataflow_row(x)) for x in msg.dataflow.values()]
+        else:
+            message = pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
+            rows = []
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM dataflows WHERE key = ?", (key,))
+                connection.executemany(
+                    "INSERT INTO dataflows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO messages VALUES (?, ?, ?)",
+                    (key, time.time(), message),
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Only used while holding the lock, by whichever thread holds it.
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    @staticmethod
+    def _key(source_id: str, kwargs: dict) -> str:
+        # Parsed structures can only be loaded by the same version of `sdmx`.
+        return "/".join(
+            [
+                sdmx.__version__,
+                source_id,
+                kwargs["resource_type"],
+                kwargs.get("agency_id") or "all",
+                kwargs.get("resource_id") or "all",
+                kwargs.get("version") or "latest",
+                kwargs.get("references") or "none",
+            ]
+        )
+
+
+def is_structure_request(kwargs: dict) -> bool:
+    """Check whether `StructureStore` can store the response to a request."""
+    return kwargs.get("resource_type") in {
+        "dataflow",
+        "datastructure",
+        "codelist",
+    } and not kwargs.get("params")
+
+
+def _is_dataflow_list(kwargs: dict) -> bool:
+    return kwargs["resource_type"] == "dataflow" and not kwargs.get("resource_id")
+
+
+def _dataflow_row(dataflow) -> tuple:
+    structure = dataflow.structure
+    return (
+        dataflow.id,
+        _maybe_str(dataflow.maintainer and dataflow.maintainer.id),
+        _maybe_str(dataflow.version),
+        json.dumps(dataflow.name.localizations),
+        json.dumps(dataflow.description.localizations),
+        _maybe_str(structure and structure.id),
+        _maybe_str(structure and structure.maintainer and structure.maintainer.id),
+        _maybe_str(structure and structure.version),
+    )
+
+
+def _dataflow_message(rows: list[tuple]) -> StructureMessage:
+    msg = StructureMessage()
+    dataflows = {}
+    agencies = {}
+
+    def agency(agency_id):
+        if agency_id is None:
+            return None
+        if agency_id not in agencies:
+            agencies[agency_id] = common.Agency(id=agency_id)
+        return agencies[agency_id]
+
+    for (
+        dataflow_id,
+        agency_id,
+        version,
+        name,
+        description,
+        structure_id,
+        structure_agency_id,
+        structure_version,
+    ) in rows:
+        structure = None
+        if structure_id is not None:
+            structure = v21.DataStructureDefinition(
+                id=structure_id,
+                maintainer=agency(structure_agency_id),
+                version=structure_version,
+                is_external_reference=True,
+            )
+        dataflows[dataflow_id] = v21.DataflowDefinition(
+            id=dataflow_id,
+            maintainer=agency(agency_id),
+            version=version,
+            name=common.InternationalString(json.loads(name)),
+            description=common.InternationalString(json.loads(description)),
+            structure=structure,
+        )
+    # Much faster than adding each dataflow to the message.
+    msg.dataflow = dataflows
+    return msg
+
+
+def _maybe_str(value) -> str | None:
+    return None if value is None else str(value)
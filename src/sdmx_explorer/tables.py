@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+
+ENGINES = {"pandas", "arrow"}
+# File extensions that can be written straight from Arrow.
+ARROW_TABLE_EXTENSIONS = {".parquet", ".feather"}
+
+
+def to_table(df: pd.DataFrame):
+    """Convert a table to Arrow."""
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def constant(value: str, length: int):
+    """Make an Arrow array that repeats the same string, without repeating the string."""
+    import pyarrow as pa
+
+    # `np.zeros` doesn't touch the memory for the indices until it is read.
+    indices = pa.array(np.zeros(length, dtype=np.int8))
+    return pa.DictionaryArray.from_arrays(indices, pa.array([value]))
+
+
+def concat_tables(tables: list):
+    """Concatenate Arrow tables without copying them.
+
+    Columns that are missing from some tables are filled with nulls, the same as
+    `pd.concat`.
+    """
+    import pyarrow as pa
+
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+def save_table(table, path: Path):
+    """Save an Arrow table to a given file path with an inferred format."""
+    import pyarrow.feather
+    import pyarrow.parquet
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    match path.suffix:
+        case ".parquet":
+            pyarrow.parquet.write_table(table, path)
+        case ".feather":
+            # The Arrow IPC file format needs the same dictionaries in every chunk.
+            pyarrow.feather.write_feather(table.unify_dictionaries(), path)
+        case _:
+            raise ValueError(
+                f"Unsupported file extension for Arrow tables: {str(path)!r}"
+            )
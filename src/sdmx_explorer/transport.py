@@ -0,0 +1,249 @@
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+import sdmx
+
+import argparse
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+import random
+import threading
+import time
+import zipfile
+
+
+# Headers that describe the encoding of the original response rather than its content.
+UNRECORDED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class MissingRecordingError(LookupError):
+    """Raised when a request is replayed but no response was recorded for it."""
+
+
+def recording_key(request: requests.PreparedRequest) -> str:
+    """Get the name that the response to a request is recorded under."""
+    # The same URL can respond in different formats (e.g. SDMX-CSV).
+    accept = request.headers.get("Accept", "")
+    return hashlib.sha256(
+        f"{request.method} {request.url} {accept}".encode()
+    ).hexdigest()
+
+
+class RecordingAdapter(BaseAdapter):
+    """Send requests through another adapter and record each response in a directory.
+
+    Each response is saved as `<key>.json` (the request, status, and headers) and
+    `<key>.body` (the decoded content), which `ReplayAdapter` can serve later.
+    Requests are sent by `adapter` (by default, a new `HTTPAdapter`), which
+    `mount_transport` replaces with the adapter of the client it records.
+    """
+
+    def __init__(self, path: Path, adapter: BaseAdapter | None = None):
+        super().__init__()
+        self.path = path
+        self.adapter = HTTPAdapter() if adapter is None else adapter
+        path.mkdir(parents=True, exist_ok=True)
+
+    def send(self, request, stream=False, **kwargs):
+        response = self.adapter.send(request, stream=stream, **kwargs)
+        content = response.content
+        key = recording_key(request)
+        metadata = {
+            "method": request.method,
+            "url": request.url,
+            "accept": request.headers.get("Accept", ""),
+            "status": response.status_code,
+            "headers": {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in UNRECORDED_HEADERS
+            },
+        }
+        _write(self.path / f"{key}.body", content)
+        _write(self.path / f"{key}.json", json.dumps(metadata, indent=2).encode())
+
+        # The content was already read, so a stream has to read it again.
+        for name in UNRECORDED_HEADERS:
+            response.headers.pop(name, None)
+        response.raw = io.BytesIO(content)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """Respond to requests with responses recorded by `RecordingAdapter`.
+
+    Recordings are read from a directory, or from a `.zip` archive of one. To simulate
+    a real SDMX source, each response can be delayed by `latency` seconds, replaced by
+    an HTTP 503 error with probability `error_rate`, and sent at `bandwidth` bytes per
+    second.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        latency: float = 0,
+        error_rate: float = 0,
+        bandwidth: float | None = None,
+        seed: int | None = None,
+    ):
+        super().__init__()
+        self.path = path
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bandwidth = bandwidth
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._archive = zipfile.ZipFile(path) if path.is_file() else None
+
+    def send(self, request, stream=False, **kwargs):
+        key = recording_key(request)
+        try:
+            metadata = json.loads(self._read(f"{key}.json"))
+            content = self._read(f"{key}.body")
+        except (FileNotFoundError, KeyError):
+            raise MissingRecordingError(
+                f"No response recorded in {str(self.path)!r} for {request.method} {request.url}"
+            )
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            metadata = {"status": 503, "headers": {}}
+            content = b"Injected error"
+
+        response = requests.Response()
+        response.status_code = metadata["status"]
+        response.headers.update(metadata["headers"])
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        if self.bandwidth:
+            response.raw = _ThrottledReader(content, self.bandwidth)
+            if not stream:
+                response._content = response.raw.read()
+        else:
+            response.raw = io.BytesIO(content)
+            if not stream:
+                response._content = content
+        return response
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+
+    def _read(self, name: str) -> bytes:
+        if self._archive is None:
+            return (self.path / name).read_bytes()
+        with self._lock:
+            # Recordings are often archived with their directory.
+            names = [x for x in self._archive.namelist() if x.endswith(name)]
+            if not names:
+                raise KeyError(name)
+            return self._archive.read(names[0])
+
+
+class _ThrottledReader(io.RawIOBase):
+    """A file-like object that reads some content no faster than `bandwidth` bytes per second."""
+
+    def __init__(self, content: bytes, bandwidth: float):
+        self._content = io.BytesIO(content)
+        self._bandwidth = bandwidth
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._content.readinto(buffer)
+        time.sleep(n / self._bandwidth)
+        return n
+
+
+def _write(path: Path, content: bytes):
+    tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+def add_transport_arguments(parser: argparse.ArgumentParser):
+    """Add command line arguments for recording or replaying responses."""
+    parser.add_argument(
+        "--record",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Record every response in this directory.",
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        default=None,
+        metavar="PATH",
+        help="Respond with the responses recorded in this directory (or .zip archive) instead of the network.",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        type=float,
+        default=0,
+        metavar="SECONDS",
+        help="Delay each replayed response by this many seconds.",
+    )
+    parser.add_argument(
+        "--replay-error-rate",
+        type=float,
+        default=0,
+        metavar="RATE",
+        help="Replace this fraction of replayed responses with HTTP 503 errors.",
+    )
+    parser.add_argument(
+        "--replay-bandwidth",
+        type=float,
+        default=None,
+        metavar="BYTES_PER_SECOND",
+        help="Send replayed responses at this many bytes per second.",
+    )
+
+
+def transport_from_arguments(
+    parser: argparse.ArgumentParser, args: argparse.Namespace
+) -> BaseAdapter | None:
+    """Get the transport adapter selected by `add_transport_arguments`, if any."""
+    if args.record is not None and args.replay is not None:
+        parser.error("argument --record: not allowed with argument --replay")
+    if args.record is not None:
+        return RecordingAdapter(args.record)
+    if args.replay is not None:
+        if not args.replay.exists():
+            parser.error(f"argument --replay: {str(args.replay)!r} does not exist")
+        return ReplayAdapter(
+            args.replay,
+            latency=args.replay_latency,
+            error_rate=args.replay_error_rate,
+            bandwidth=args.replay_bandwidth,
+        )
+    return None
+
+
+def mount_transport(client: sdmx.Client, adapter: BaseAdapter | None) -> sdmx.Client:
+    """Send every request of a client through a transport adapter."""
+    if isinstance(adapter, RecordingAdapter):
+        # Keep the connection pool and timeouts of the client's own adapter.
+        adapter.adapter = client.session.get_adapter("https://")
+    if adapter is not None:
+        client.session.mount("https://", adapter)
+        client.session.mount("http://", adapter)
+    return client
+
+
+def client_like(client: sdmx.Client) -> sdmx.Client:
+    """Make a new client (e.g. for another thread) that shares the session of `client`.
+
+    The session's transport, HTTP cache, and open connections are all shared.
+    """
+    return sdmx.Client(session=client.session)